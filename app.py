@@ -1,20 +1,25 @@
 import streamlit as st
 from audio_recorder_streamlit import audio_recorder
-from groq_models import create_groq_agent, groq_chatbot, get_tools, summarizer_model
-from PIL import Image
-from io import BytesIO
-import base64
-import docx
-from streamlit_lottie import st_lottie
 import json
-from utils import set_safety_settings, about
+from functools import partial
+from utils import set_safety_settings, about, key_fingerprint
+from gemini_files import get_file_registry, file_part, upload_files, EXPIRY_MARGIN_SECONDS
+from blob_store import get_blob_store
+from clients import get_gemini_model, get_gemini_file_client
+from documents import retrieve_excerpts
+from conversation_store import PersistentHistory, load_history, new_session_id, is_session_id
+from context_manager import get_conversation_context, message_tokens, count_tokens, CONTEXT_TOKEN_BUDGET, SUMMARY_MAX_TOKENS
+from voice import StreamingVoice, get_speech_cache, audio_player_html, clean_text_for_speech
+from lazy_imports import lazy_import, import_report
+from rate_limiter import get_rate_limiter, waiting_as, acquire, retrying_stream, retrying_call, describe_error
+from tracing import span, traced_stream, current_span, get_tracer, RECENT_TRACES
+from hedging import get_hedge_metrics, HEDGE_DELAY_MS
+from response_cache import is_cacheable, response_cache_key, cached_stream, get_session_metrics, normalize_text
+from media_processing import add_preprocessed_image, add_preprocessed_audio, image_thumbnail, IMAGE_MAX_EDGE, IMAGE_QUALITY, IMAGE_FORMAT, IMAGE_FORMATS
 from streamlit_mic_recorder import speech_to_text
-import google.generativeai as genai
-import os, random, validators
+from contextlib import contextmanager
+import validators
 import time
-import tempfile
-import asyncio
-import edge_tts
 
 st.set_page_config(
     page_title="Super AI Assistant",
@@ -33,6 +38,8 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+GEMINI_SYSTEM_INSTRUCTION = """You are a helpful assistant who asnwers user's questions professionally and politely."""
+
 google_models = [
     "gemini-1.5-flash",
     "gemini-1.5-pro",
@@ -47,6 +54,10 @@ groq_models = [
     "mixtral-8x7b-32768"
 ]
 
+# Older messages are shown as previews so reruns stay fast in long conversations
+HISTORY_WINDOW = 10
+PREVIEW_CHARS = 160
+
 voices = {
     "William":"en-AU-WilliamNeural",
     "James":"en-PH-JamesNeural",
@@ -60,29 +71,27 @@ def load_lottie_file(filepath: str):
     with open(filepath, "r") as f:
         return json.load(f)
 
-###--- FUNCTION FOR SPEECH GENERATION---###
-async def generate_speech(text, voice):
-    communicate = edge_tts.Communicate(text, voice)
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as temp_file:
-        await communicate.save(temp_file.name)
-        temp_file_path = temp_file.name
-    return temp_file_path
-
-###---AUTOPLAY SPEECH---###
-def get_audio_player(file_path):
-    with open(file_path, "rb") as f:
-        data = f.read()
-        b64 = base64.b64encode(data).decode()
-        return f'<audio autoplay="true" src="data:audio/mp3;base64,{b64}">'
-        
-###---SPEECH FILE TO AUTOPLAY AUDIO---###
+###---SPEECH TO AUTOPLAY AUDIO---###
 def generate_voice(text, voice):
-    text_to_speak = (text).translate(str.maketrans('', '', '#-*_😊👋😄😁🥳👍🤩😂😎')) # Removing special chars and emojis
+    text_to_speak = clean_text_for_speech(text) # Removing special chars and emojis
     with st.spinner("Generating voice response..."):
-        temp_file_path = asyncio.run(generate_speech(text_to_speak, voice)) 
-        audio_player_html = get_audio_player(temp_file_path)  # Create an audio player
-        st.markdown(audio_player_html, unsafe_allow_html=True)
-        os.unlink(temp_file_path)  # Clean up the temporary audio file
+        audio = get_speech_cache().synthesize(text_to_speak, voice)  # Served from the TTS cache when possible
+        st.markdown(audio_player_html(audio), unsafe_allow_html=True)
+
+###---SELECTED VOICE, IF ANY---###
+def get_response_voice():
+    if "voice_response" in st.session_state and st.session_state.voice_response:
+        return voices[st.session_state.voice_response]
+    return None
+
+def is_streaming_voice():
+    return get_response_voice() is not None and st.session_state.get("stream_voice", True)
+
+###---SPEAKING SENTENCES WHILE THE RESPONSE STREAMS---###
+def with_streaming_voice(stream):
+    if is_streaming_voice():
+        return StreamingVoice(get_response_voice()).speak(stream)
+    return stream
 
 ###---LLM & PARAMETERS---###
 def get_llm_info(available_models):
@@ -100,174 +109,255 @@ def get_llm_info(available_models):
             
             max_tokens = st.slider("Maximum Tokens:", min_value=100,
                                         max_value=2000, value=400, step=200)
+            st.toggle("Cache identical answers", key="cache_responses",
+                      help="Replay the stored answer when the same question is asked with the same history. "
+                           "Only used at temperature 0.")
+            if st.session_state.cache_responses:
+                metrics = get_session_metrics()
+                st.caption(f"Response cache: {metrics['hits']} hits, {metrics['misses']} misses this session")
+            if model_type == "groq":
+                st.toggle("Fast mode", key="fast_mode",
+                          help="If the first words take too long, ask a backup model as well and show whichever answers first. "
+                               "Used by the Chatbot.")
+                if st.session_state.fast_mode:
+                    st.selectbox("Backup model:", [name for name in available_models if name != model and name in groq_models],
+                                 key="hedge_model")
+                    st.slider("Ask the backup after (ms):", min_value=100, max_value=3000, value=HEDGE_DELAY_MS, step=100,
+                              key="hedge_delay_ms")
+                    metrics = get_hedge_metrics()
+                    st.caption(f"Fast mode: backup asked in {metrics['hedged']} and answered first in "
+                               f"{metrics['backup_wins']} of {metrics['turns']} answers this session")
+                    if metrics["wins_by_model"]:
+                        st.caption("Answered first: " + ", ".join(f"{name} ({wins})" for name, wins in metrics["wins_by_model"].items()))
     return model, model_type, temp, max_tokens
 
 
-###--- Function to convert base64 to temp file ---###
-def base64_to_temp_file(base64_string, unique_name, file_extension):
-    file_bytes = BytesIO(base64.b64decode(base64_string.split(",")[1]))
-    temp_file_path = f"{unique_name}.{file_extension}"
-    with open(temp_file_path, "wb") as temp_file:
-        temp_file.write(file_bytes.read())
-    return temp_file_path
+UPLOADED_CONTENT_TYPES = ["video_file", "audio_file", "speech_input"]
 
-##----Preparing messages for Gemini----##
-def messages_to_gemini(messages):
-    gemini_messages = []
-    prev_role = None
-    uploaded_files = set([file.display_name.split(".")[0] for file in genai.list_files()])
+##----Uploading every new media file of the conversation at once----##
+def upload_pending_media(messages, registry, owner, client):
+    blob_store = get_blob_store()
+    pending = {}
 
     for message in messages:
-        if prev_role and (prev_role == message["role"]):
-            gemini_message = gemini_messages[-1]
-        else:
-            gemini_message = {
-                "role": "model" if message["role"] == "assistant" else "user",
-                "parts": [],
-            }
-
         for content in message["content"]:
-            content_type = content["type"]
+            if content["type"] not in UPLOADED_CONTENT_TYPES:
+                continue
 
-            if content_type in ["text","docx_file"]:
-                gemini_message["parts"].append(content[content_type])
+            blob_hash = content["blob"]
+            if blob_hash in pending or blob_hash not in blob_store or registry.get(blob_hash, owner) is not None:
+                continue
+            pending[blob_hash] = (blob_store.open(blob_hash), content["mime_type"])
 
-            elif content_type == "image_url":
-                gemini_message["parts"].append(base64_to_image(content["image_url"]["url"]))
+    if not pending:
+        return
 
-            elif content_type in ["video_file", "audio_file", "speech_input"]:
-                file_name = content['unique_name']
+    try:
+        with span("gemini.upload", files=len(pending)), st.status(f"Sending {len(pending)} file(s) to Gemini...") as status:
+            progress = st.progress(0.0)
+            for done, (blob_hash, file) in enumerate(upload_files(pending, client), start=1):
+                registry.put(blob_hash, owner, file)
+                progress.progress(done / len(pending), text=f"{done}/{len(pending)} ready")
+            status.update(label="Files are ready", state="complete")
+    finally:
+        for source, _ in pending.values():
+            source.close()
 
-                if file_name not in uploaded_files:
-                    temp_file_path = base64_to_temp_file(content[content_type], file_name, "mp4" if content_type == "video_file" else "wav")
+##----Converting one message to Gemini parts----##
+def message_to_gemini_parts(message, registry, owner):
+    parts = []
+    usable_until = float("inf")
 
-                    with st.spinner(f"Sending {content_type.replace('_', ' ')} to Gemini..."):
-                        file = genai.upload_file(path=temp_file_path)
+    for content in message["content"]:
+        content_type = content["type"]
 
-                        while file.state.name == "PROCESSING":
-                            st.write(':green[One moment, please.]')
-                            time.sleep(10)
-                            file = genai.get_file(file.name)
+        if content_type == "text":
+            parts.append(content["text"])
 
-                        if file.state.name == "FAILED":
-                            raise ValueError(file.state.name)
+        elif content_type == "image_file":
+            # Only a reference is memoized; the bytes are read from the blob store when the request is built
+            parts.append({"image_blob": content["blob"], "mime_type": content["mime_type"]})
 
-                        file = genai.get_file(name=file.name)
-                        gemini_message["parts"].append(file)
-                    os.remove(temp_file_path)
+        elif content_type in UPLOADED_CONTENT_TYPES:
+            record = registry.get(content["blob"], owner)
+            if record is not None:
+                parts.append(file_part(record))
+                usable_until = min(usable_until, record["expires_at"] - EXPIRY_MARGIN_SECONDS)
 
-            elif content_type == "pdf_file":
-                if content['pdf_file'].split(".")[0] not in uploaded_files:
-                    with st.spinner("Sending your PDF to Gemini..."):
-                        gemini_message["parts"].append(genai.upload_file(path=content['pdf_file']))
-                    os.remove(content['pdf_file'])
+    return {"role": message["role"], "parts": parts, "usable_until": usable_until}
 
-        if prev_role != message["role"]:
-            gemini_messages.append(gemini_message)
+##----Preparing messages for Gemini----##
+def messages_to_gemini(messages, api_key, start=0, summary=""):
+    registry = get_file_registry()
+    # Uploaded files belong to the project behind the key, so the key is part of the registry key
+    owner = key_fingerprint(api_key)
+
+    # Converted messages are memoized per session, only new turns are converted
+    if "gemini_parts_cache" not in st.session_state or st.session_state.gemini_parts_cache["owner"] != owner:
+        st.session_state.gemini_parts_cache = {"owner": owner, "messages": []}
+    converted = st.session_state.gemini_parts_cache["messages"]
+
+    if len(converted) > len(messages):
+        converted.clear()
+
+    # Reconvert from the first message whose uploaded files have expired
+    now = time.time()
+    for index, converted_message in enumerate(converted):
+        if converted_message["usable_until"] <= now:
+            del converted[index:]
+            break
+
+    new_messages = messages[len(converted):]
+    with span("gemini.convert", messages=len(new_messages)):
+        upload_pending_media(new_messages, registry, owner, get_gemini_file_client(api_key))
+        converted.extend(message_to_gemini_parts(message, registry, owner) for message in new_messages)
 
-        prev_role = message["role"]
+    gemini_messages = []
+    prev_role = None
+    for converted_message in converted[start:]:
+        parts = [image_part(part["image_blob"], part["mime_type"]) if isinstance(part, dict) and "image_blob" in part else part
+                 for part in converted_message["parts"]]
+        if prev_role == converted_message["role"]:
+            gemini_messages[-1]["parts"].extend(parts)
+        else:
+            gemini_messages.append({
+                "role": "model" if converted_message["role"] == "assistant" else "user",
+                "parts": parts,
+            })
+        prev_role = converted_message["role"]
+
+    # Older turns are represented by their rolling summary; the conversation must start with the user
+    if start > 0:
+        summary_text = f"Summary of the earlier conversation: {summary}" if summary else "(Earlier conversation omitted.)"
+        if gemini_messages and gemini_messages[0]["role"] == "user":
+            gemini_messages[0]["parts"].insert(0, summary_text)
+        else:
+            gemini_messages.insert(0, {"role": "user", "parts": [summary_text]})
 
     return gemini_messages
 
 
-##-- Converting base64 to image ---##
-def base64_to_image(base64_string):
-    
-    return Image.open(BytesIO(base64.b64decode(base64_string.split(",")[1])))
+##-- Converting a stored image to an inline part ---##
+def image_part(blob_hash, mime_type):
+    # An image evicted from the blob store is replaced by a note, so the rest of the conversation still works
+    try:
+        data = get_blob_store().get(blob_hash)
+    except (KeyError, OSError):
+        return "(image no longer available)"
+    # Sent as-is; a PIL image would be re-encoded by the SDK as lossless WebP
+    return {"inline_data": {"mime_type": mime_type, "data": bytes(data)}}
+
+##-- Downscaling images before they are stored and sent ---##
+def add_image_to_messages(data, mime_type):
+    image = add_preprocessed_image(
+        data, mime_type,
+        max_edge=st.session_state.get("image_max_edge", IMAGE_MAX_EDGE),
+        quality=st.session_state.get("image_quality", IMAGE_QUALITY),
+        image_format=st.session_state.get("image_format", IMAGE_FORMAT),
+    )
+    saved = image["original_size"] - image["size"]
+    if saved > 0:
+        st.toast(f"Image optimized: {image['original_size'] / 1024:,.0f} KB → {image['size'] / 1024:,.0f} KB ({saved / 1024:,.0f} KB saved)")
+
+    st.session_state.messages.append(
+        {
+            "role": "user", 
+            "content": [{
+                "type": "image_file",
+                "blob": image["blob"],
+                "mime_type": image["mime_type"],
+                "bytes_saved": saved,
+            }]
+        }
+    )
 
 ##-- Handle PDF and Docx files ---##
-def add_pdf_docx_file_to_messages():
+def add_pdf_docx_file_to_documents():
     if st.session_state.pdf_docx_uploaded:
-        file_type = st.session_state.pdf_docx_uploaded.type
-        if file_type == "application/pdf":
-        # Save the PDF file
-            pdf_id = random.randint(1000, 9999)
-            pdf_filename = f"pdf_{pdf_id}.pdf"
-            with open(pdf_filename, "wb") as f:
-                f.write(st.session_state.pdf_docx_uploaded.read())
-            
-            # Add the PDF file to session_state messages
-            st.session_state.messages.append(
-                {
-                    "role": "user", 
-                    "content": [{
-                        "type": "pdf_file",
-                        "pdf_file": pdf_filename,
-                    }]
-                }
-            )
-        else:
-            file_content = st.session_state.pdf_docx_uploaded
-            doc = docx.Document(file_content)
-            text = " ".join(para.text for para in doc.paragraphs)
-
-            # Add the DOCX file to session_state messages
-            st.session_state.messages.append(
-                {
-                    "role": "user", 
-                    "content": [{
-                        "type": "docx_file",
-                        "docx_file": text,
-                    }]
-                }
-            )
+        uploaded = st.session_state.pdf_docx_uploaded
+        # Documents are indexed locally, only the chunks relevant to each question are sent to the LLM
+        doc_blob = get_blob_store().put_file(uploaded)
+
+        if "documents" not in st.session_state:
+            st.session_state.documents = []
+        if all(document["blob"] != doc_blob for document in st.session_state.documents):
+            st.session_state.documents.append({"blob": doc_blob, "mime_type": uploaded.type, "name": uploaded.name})
+
+##-- Relevant document chunks for a question ---##
+def get_document_excerpts(question):
+    if not st.session_state.get("documents") or not question:
+        return ""
+    return retrieve_excerpts(st.session_state.documents, question)
+
+##-- PDF / DOCX uploader shared by both model types ---##
+def show_document_uploader():
+    tip = "The file is indexed locally; only the parts relevant to your question are sent to the LLM."
+    st.file_uploader("Upload a PDF or Docx file", type=["pdf", "docx"], key="pdf_docx_uploaded", on_change=add_pdf_docx_file_to_documents, help=tip)
 
 ##--- Function for adding media files to session_state messages ---###
 def add_media_files_to_messages():
     if st.session_state.uploaded_file:
         file_type = st.session_state.uploaded_file.type
-        file_content = st.session_state.uploaded_file.getvalue()
-        
-        encoded_file = base64.b64encode(file_content).decode()
         content_type = None
         
         if file_type.startswith("image"):
-            content_type = "image_url"
-            data_url = f"data:{file_type};base64,{encoded_file}"
+            add_image_to_messages(st.session_state.uploaded_file.getvalue(), file_type)
 
         elif file_type == "video/mp4":
             content_type = "video_file"
-            unique_id = f"temp_{random.randint(1000, 9999)}"
-            data_url = f"data:{file_type};base64,{encoded_file}"
 
         elif file_type.startswith("audio"):
-            content_type = "audio_file"
-            unique_id = f"temp_{random.randint(1000, 9999)}"
-            data_url = f"data:{file_type};base64,{encoded_file}"
+            add_audio_to_messages(st.session_state.uploaded_file.getvalue(), file_type, "audio_file")
 
         # Only append if the content type is recognized
         if content_type:
-            message_content = {"type": content_type}
-            if content_type == "image_url":
-                message_content["image_url"] = {"url": data_url}
-            else:
-                message_content[content_type] = data_url
-                message_content["unique_name"] = unique_id
+            # Messages only keep a reference, the bytes live in the shared blob store
+            blob_hash = get_blob_store().put_file(st.session_state.uploaded_file)
 
             st.session_state.messages.append(
                 {
                     "role": "user", 
-                    "content": [message_content]
+                    "content": [{
+                        "type": content_type,
+                        "blob": blob_hash,
+                        "mime_type": file_type,
+                    }]
                 }
             )
 
+##-- Trimming silence and downsampling WAV audio before it is stored and sent ---##
+def add_audio_to_messages(data, mime_type, content_type):
+    if st.session_state.get("audio_preprocessing", True):
+        audio = add_preprocessed_audio(data, mime_type)
+    else:
+        audio = {"blob": get_blob_store().put(data), "mime_type": mime_type, "original_size": len(data), "size": len(data)}
+    saved = audio["original_size"] - audio["size"]
+    if saved > 0 and content_type == "audio_file":
+        st.toast(f"Audio optimized: {audio['original_size'] / 1024:,.0f} KB → {audio['size'] / 1024:,.0f} KB ({saved / 1024:,.0f} KB saved)")
+
+    st.session_state.messages.append(
+        {
+            "role": "user",
+            "content": [{
+                "type": content_type,
+                "blob": audio["blob"],
+                "mime_type": audio["mime_type"],
+                "bytes_saved": saved,
+            }]
+        }
+    )
+
 ###--- FUNCTION TO ADD CAMERA IMAGE TO MESSAGES ---##
 def add_camera_img_to_messages():
     if "camera_img" in st.session_state and st.session_state.camera_img:
-        img = base64.b64encode(st.session_state.camera_img.getvalue()).decode()
-        st.session_state.messages.append(
-            {
-                "role": "user", 
-                "content": [{
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img}"}
-                }]
-            }
-        )
+        add_image_to_messages(st.session_state.camera_img.getvalue(), "image/jpeg")
 
 ##--- FUNCTION TO RESET CONVERSATION ---##
 def reset_conversation():
-    keys_to_reset = ["messages", "groq_chat_history", "uploaded_files", "pdf_docx_uploaded"]
+    # The old session stays in the store (and resumable by its link); a new one starts empty
+    start_new_session()
+    keys_to_reset = ["messages", "groq_chat_history", "uploaded_files", "pdf_docx_uploaded", "documents", "gemini_parts_cache",
+                     "expanded_messages", "conversation_contexts"]
 
     for key in keys_to_reset:
         if key in st.session_state:
@@ -277,21 +367,55 @@ def reset_conversation():
     #     genai.delete_file(file.name)
 
 
+def cache_key_message(message):
+    # Media is identified by its content hash, so the same picture asked about twice hits the cache
+    contents = [normalize_text(content["text"]) if content["type"] == "text"
+                else f"{content['type']}:{content['blob']}"
+                for content in message["content"]]
+    return f"{message['role']}: {' | '.join(contents)}"
+
+
 ##--- FUNCTION TO STREAM GEMINI RESPONSE ---##
-def stream_gemini_response(model_params, api_key):
+def stream_gemini_response(model_params, api_key, document_excerpts=""):
     response_message = ""
 
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel(
-            model_name = model_params["model"],
-            generation_config={"temperature": model_params["temperature"], "max_output_tokens": model_params["max_tokens"]},
+    model = get_gemini_model(
+            api_key=api_key,
+            model=model_params["model"],
+            temperature=model_params["temperature"],
+            max_tokens=model_params["max_tokens"],
             safety_settings=set_safety_settings(),
-            system_instruction="""You are a helpful assistant who asnwers user's questions professionally and politely."""
+            system_instruction=GEMINI_SYSTEM_INSTRUCTION
         )
-    gemini_messages = messages_to_gemini(st.session_state.messages)
-
-    for chunk in model.generate_content(contents=gemini_messages, stream=True):
-        chunk_text = chunk.text or ""
+    context = get_conversation_context("google")
+    summary, start = context.window(st.session_state.messages, model_params["model"], get_context_budget())
+
+    scheduler = get_rate_limiter().scheduler("google", api_key, model_params["model"])
+    prompt_tokens = sum(message_tokens(message, model_params["model"]) for message in st.session_state.messages[start:])
+    prompt_tokens += count_tokens(document_excerpts, model_params["model"])
+
+    def generate():
+        # Media is only uploaded when the answer is not already cached
+        gemini_messages = messages_to_gemini(st.session_state.messages, api_key, start, summary)
+        if document_excerpts:
+            # Excerpts are context for the current question only; they are never stored with the conversation
+            gemini_messages[-1]["parts"].append(document_excerpts)
+        acquire(scheduler, prompt_tokens + model_params["max_tokens"])
+        usage = None
+        for chunk in model.generate_content(contents=gemini_messages, stream=True):
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            yield chunk.text or ""
+        if usage and current_span():
+            current_span().set(prompt_tokens=usage.prompt_token_count, completion_tokens=usage.candidates_token_count)
+
+    stream = partial(retrying_stream, generate, scheduler)
+    if is_cacheable(model_params["temperature"]):
+        history = [summary] + [cache_key_message(message) for message in st.session_state.messages[start:-1]]
+        key = response_cache_key(model_params["model"], model_params["temperature"], model_params["max_tokens"],
+                                 GEMINI_SYSTEM_INSTRUCTION + document_excerpts, history, cache_key_message(st.session_state.messages[-1]))
+        stream = partial(cached_stream, key, stream)
+
+    for chunk_text in traced_stream("gemini.response", stream(), model=model_params["model"]):
         response_message += chunk_text
         yield chunk_text
 
@@ -304,6 +428,31 @@ def stream_gemini_response(model_params, api_key):
         }
     ]})
 
+    context.fold_in_background(st.session_state.messages, model_params["model"],
+                               partial(summarize_with_gemini, api_key, model_params["model"]), get_context_budget())
+
+##--- FUNCTION TO SUMMARIZE OLDER TURNS WITH GEMINI ---##
+def summarize_with_gemini(api_key, model_name, prompt):
+    model = get_gemini_model(api_key=api_key, model=model_name, temperature=0, max_tokens=SUMMARY_MAX_TOKENS,
+                             safety_settings=set_safety_settings(),
+                             system_instruction="You summarize conversations accurately and concisely.")
+    scheduler = get_rate_limiter().scheduler("google", api_key, model_name)
+
+    def summarize():
+        acquire(scheduler, len(prompt) // 4 + SUMMARY_MAX_TOKENS)
+        return model.generate_content(prompt).text
+    return retrying_call(summarize, scheduler)
+
+def get_context_budget():
+    return st.session_state.get("context_budget", CONTEXT_TOKEN_BUDGET)
+
+##--- GROQ HISTORY WITHIN THE CONTEXT BUDGET ---##
+def windowed_groq_history(history, model):
+    summary, start = get_conversation_context("groq").window(history, model, get_context_budget())
+    if not summary:
+        return history[start:]
+    return [{"role": "system", "content": f"Summary of the earlier conversation: {summary}"}] + history[start:]
+
 
 if "summarize" not in st.session_state:
     st.session_state.summarize = False
@@ -313,23 +462,119 @@ def validate_api_keys(groq_api_key=None, google_api_key=None):
 
     return ("gsk" in groq_api_key if groq_api_key else False) or ("AIza" in google_api_key if google_api_key else False)
 
+##--- Calls wait in a fair per-key queue; the user sees their position while waiting ---##
+@contextmanager
+def rate_limit_queue():
+    placeholder = st.empty()
+
+    def show_position(position, seconds):
+        if position > 1:
+            placeholder.info(f"⏳ {position - 1} request(s) ahead of yours for this API key...")
+        else:
+            placeholder.info(f"⏳ Waiting {seconds:.0f} s for the provider's rate limit...")
+
+    try:
+        with waiting_as(get_session_id(), show_position):
+            yield
+    finally:
+        placeholder.empty()
+
+##--- Conversations are stored per session id, which is kept in the URL so a refresh resumes it ---##
+def get_session_id():
+    if "session_id" not in st.session_state:
+        session_id = st.query_params.get("session")
+        st.session_state.session_id = session_id if is_session_id(session_id) else new_session_id()
+        st.query_params["session"] = st.session_state.session_id
+    return st.session_state.session_id
+
+def start_new_session():
+    st.session_state.session_id = new_session_id()
+    st.query_params["session"] = st.session_state.session_id
+
+def with_older_turns(message_container, history, to_visible):
+    """Turns paged in from the store are shown above the loaded window; returns (visible messages, offset)."""
+    if not isinstance(history, PersistentHistory):
+        return to_visible(history), 0
+    if history.has_older():
+        message_container.button("Load older messages", key=f"older_{history.conversation}",
+                                 on_click=history.load_older, use_container_width=True)
+    older = to_visible(history.older)
+    return older + to_visible(history), -len(older)
+
+def visible_gemini_messages(messages):
+    visible_messages = []
+    for message in messages:
+        valid_contents = [content for content in message["content"] if is_valid_content(content)]
+        if valid_contents:
+            visible_messages.append((message["role"], valid_contents))
+    return visible_messages
+
+def visible_groq_messages(messages):
+    return [(msg["role"], [{"type": "text", "text": msg["content"]}]) for msg in messages]
+
+
 ###--- DISPLAYING CHAT HISTORY---###
 def render_content(content):
     content_type = content["type"]
     if content_type == "text":
         st.markdown(content["text"])
-    elif content_type == "image_url":
-        st.image(content["image_url"]["url"])
+        return
+
+    blob_store = get_blob_store()
+    if content.get("blob") not in blob_store:
+        st.caption(":grey[This file is no longer available.]")
+    elif content_type == "image_file":
+        st.image(blob_store.source(content["blob"]))
     elif content_type == "video_file":
-        st.video(content["video_file"])
+        st.video(blob_store.source(content["blob"]), format=content["mime_type"])
     elif content_type in ["audio_file", "speech_input"]:
-        st.audio(content[content_type], autoplay=content_type == "audio_file")
+        st.audio(blob_store.source(content["blob"]), format=content["mime_type"], autoplay=content_type == "audio_file")
+
+###--- LIGHTWEIGHT PLACEHOLDER FOR COLLAPSED MESSAGES---###
+MEDIA_LABELS = {"video_file": "🎬 Video", "audio_file": "🎧 Audio", "speech_input": "🎙️ Voice message"}
+
+def render_preview(content):
+    content_type = content["type"]
+    if content_type == "text":
+        text = " ".join(content["text"].split())
+        st.caption(text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS] + "…")
+    elif content.get("blob") not in get_blob_store():
+        st.caption(":grey[This file is no longer available.]")
+    elif content_type == "image_file":
+        st.image(image_thumbnail(content["blob"]))
+    elif content_type in MEDIA_LABELS:
+        st.caption(MEDIA_LABELS[content_type])
+
+def expand_message(message_key):
+    st.session_state.expanded_messages.add(message_key)
+
+###--- ONLY THE LAST TURNS ARE RENDERED IN FULL ---###
+def display_history(message_container, messages, offset=0):
+    if "expanded_messages" not in st.session_state:
+        st.session_state.expanded_messages = set()
+
+    first_full = max(0, len(messages) - st.session_state.get("history_window", HISTORY_WINDOW))
+    if first_full:
+        message_container.caption(f":grey[{first_full} earlier messages are collapsed, click Load to show one.]")
+
+    for index, (role, contents) in enumerate(messages):
+        avatar = "assets/assistant.png" if role == "assistant" else "assets/user.png"
+        message_key = f"{model_type}_{offset + index}"
+        collapsed = index < first_full and message_key not in st.session_state.expanded_messages
+
+        with message_container.chat_message(role, avatar=avatar):
+            if collapsed:
+                for content in contents:
+                    render_preview(content)
+                st.button("Load", key=f"load_{message_key}", on_click=expand_message, args=(message_key,))
+            else:
+                for content in contents:
+                    render_content(content)
 
 ###--VALIDATING CONTENT TO BE DISPLAYED--###
 def is_valid_content(content):
     return not (
-        (content["type"] == "text" and content["text"] == "Listen attentively to the audio. If there is a question in the audio, answer it professionally.") or
-        content["type"] in ["pdf_file", "docx_file"]
+        content["type"] == "text" and content["text"] == "Listen attentively to the audio. If there is a question in the audio, answer it professionally."
     )
 
 
@@ -338,16 +583,36 @@ def update_chat_history(role, content, history):
     history.append({"role": role, "content": content})
 
 ###---GROQ MODELS RESPONSE---###
-def handle_groq_response(model_params, api_key, question, chat_history, llm_type, tools):
+def handle_groq_response(model_params, api_key, question, chat_history, llm_type, tools, document_excerpts=""):
+    # The Groq/LangChain stack is imported the first time a Groq model answers
+    groq = lazy_import("groq_models")
     if llm_type == "Chatbot":
-        return st.write_stream(groq_chatbot(model_params=model_params, api_key=api_key,
-                                            question=question, chat_history=chat_history))
+        stream = groq.groq_chatbot(model_params=model_params, api_key=api_key, question=question, chat_history=chat_history,
+                                   document_excerpts=document_excerpts)
+        return st.write_stream(with_streaming_voice(traced_stream("groq.response", stream, model=model_params["model"])))
     elif llm_type == "Agent":
-        response = create_groq_agent(model_params=model_params, api_key=api_key,
-                                     question=question, tools=get_tools(tools),
-                                     chat_history=chat_history)
-        st.markdown(response)
-        return response
+        prefetch = st.session_state.get("tool_prefetch", False)
+        start = time.perf_counter()
+        with span("groq.agent", model=model_params["model"], prefetch=prefetch):
+            answer = groq.create_groq_agent(model_params=model_params, api_key=api_key,
+                                            question=question, tools=groq.get_tools(tools),
+                                            chat_history=chat_history, prefetch=prefetch, document_excerpts=document_excerpts)
+            placeholder = st.empty()
+            response = placeholder.write_stream(with_streaming_voice(traced_stream("groq.response", answer, model=model_params["model"])))
+        if response.strip() != answer.output.strip():
+            # A final answer the agent later discarded (parsing error) was streamed, show the one it settled on
+            placeholder.markdown(answer.output)
+        show_agent_latency("prefetch" if prefetch else "sequential", time.perf_counter() - start)
+        return answer.output
+
+###---AGENT LATENCY BY MODE---###
+def show_agent_latency(mode, seconds):
+    latencies = st.session_state.setdefault("agent_latencies", {"prefetch": [], "sequential": []})
+    latencies[mode].append(seconds)
+
+    averages = [f"{name}: {sum(values) / len(values):.1f} s avg over {len(values)}"
+                for name, values in latencies.items() if values]
+    st.caption(f":grey[Answered in {seconds:.1f} s · {' · '.join(averages)}]")
 
 ###---- MAIN FUNCTION FOR ALL MODELS CONVERSATION HANDLING---###
 def process_user_input(message_container, trasncribed_text):
@@ -368,36 +633,45 @@ def process_user_input(message_container, trasncribed_text):
 
         with message_container.chat_message("assistant", avatar="assets/assistant.png"):
             try:
-                final_response = handle_groq_response(model_params, groq_api_key, question, 
-                                                      st.session_state.groq_chat_history, 
-                                                      groq_llm_type, st.session_state.selected_tools)
-                update_chat_history("assistant", final_response, st.session_state.groq_chat_history)
-                if "voice_response" in st.session_state and st.session_state.voice_response:
-                    response_voice = st.session_state.voice_response
-                    generate_voice(final_response, voices[response_voice])
+                with span("turn", provider="groq", model=model_params["model"], mode=groq_llm_type), rate_limit_queue():
+                    final_response = handle_groq_response(model_params, groq_api_key, question,
+                                                          windowed_groq_history(st.session_state.groq_chat_history, model_params["model"]),
+                                                          groq_llm_type, st.session_state.selected_tools,
+                                                          get_document_excerpts(question))
+                    update_chat_history("assistant", final_response, st.session_state.groq_chat_history)
+
+                    context = get_conversation_context("groq")
+                    context.fold_in_background(st.session_state.groq_chat_history, model_params["model"],
+                                               partial(lazy_import("groq_models").summarize_conversation, groq_api_key, model_params["model"]),
+                                               get_context_budget())
+                    if get_response_voice() and not is_streaming_voice():
+                        generate_voice(final_response, get_response_voice())
 
             except Exception as e:
-                st.error(f"An error occurred: {e}", icon="❌")
+                st.error(f"An error occurred: {describe_error(e)}", icon="❌")
 
     else:  # Gemini models
         if not st.session_state.speech_file_added:
             message_container.chat_message("user", avatar="assets/user.png").markdown(prompt)
             content = [{"type": "text", "text": prompt}]
+            document_excerpts = get_document_excerpts(prompt)
         else:
             content = [{"type": "text", "text": "Listen attentively to the audio. If there is a question in the audio, answer it professionally."}]
+            document_excerpts = ""
 
         update_chat_history("user", content, st.session_state.messages)
 
         with message_container.chat_message("assistant", avatar="assets/assistant.png"):
             try:
-                final_response = st.write_stream(stream_gemini_response(model_params=model_params, api_key=google_api_key))
+                with span("turn", provider="google", model=model_params["model"]), rate_limit_queue():
+                    response = stream_gemini_response(model_params=model_params, api_key=google_api_key, document_excerpts=document_excerpts)
+                    final_response = st.write_stream(with_streaming_voice(response))
 
-                if "voice_response" in st.session_state and st.session_state.voice_response:
-                    response_voice = st.session_state.voice_response
-                    generate_voice(final_response, voices[response_voice])
+                    if get_response_voice() and not is_streaming_voice():
+                        generate_voice(final_response, get_response_voice())
 
             except Exception as e:
-                st.error(f"An error occurred: {e}", icon="❌")
+                st.error(f"An error occurred: {describe_error(e)}", icon="❌")
 
 
 
@@ -426,11 +700,16 @@ else:
         with columns[0]:
             lottie_animation = load_lottie_file("assets/animation.json")
             if lottie_animation:
-                st_lottie(lottie_animation, height=100, width=100, quality="high", key="lottie_anim")
+                lazy_import("streamlit_lottie").st_lottie(lottie_animation, height=100, width=100, quality="high", key="lottie_anim")
 
         with columns[1]:
             if st.toggle("Voice Response"):
                 response_voice = st.selectbox("Available Voices:", options=voices.keys(), key="voice_response")
+                st.toggle("Stream voice", value=True, key="stream_voice",
+                          help="Start speaking as soon as the first sentence is ready.")
+                speech_cache_stats = get_speech_cache().stats()
+                st.caption(f"Voice cache: {speech_cache_stats['hit_rate']:.0%} hits, "
+                           f"{speech_cache_stats['bytes_served'] / 1024:,.0f} KB served")
     
         available_models = (google_models if google_api_key else []) + (groq_models if groq_api_key else [])
         model, model_type, temperature, max_tokens = get_llm_info(available_models)
@@ -438,8 +717,20 @@ else:
         model_params = {
                 "model": model,
                 "temperature": temperature,
-                "max_tokens": max_tokens
+                "max_tokens": max_tokens,
+                "hedge_model": st.session_state.hedge_model if model_type == "groq" and st.session_state.get("fast_mode") else None,
+                "hedge_delay_ms": st.session_state.get("hedge_delay_ms", HEDGE_DELAY_MS),
             }
+        with st.popover("🗂️ Chat History", use_container_width=True):
+            st.slider("Messages shown in full:", min_value=2, max_value=50, value=HISTORY_WINDOW, step=2, key="history_window",
+                      help="Older messages are collapsed into previews that can be loaded on demand.")
+            st.slider("Context budget (tokens):", min_value=1000, max_value=16000, value=CONTEXT_TOKEN_BUDGET, step=500,
+                      key="context_budget", help="Recent turns are sent up to this budget, older turns are sent as a rolling summary.")
+        if st.toggle("Latency debug panel", key="latency_panel"):
+            st.dataframe(get_tracer().percentiles(), hide_index=True, use_container_width=True)
+            st.caption(f"Spans of the last {RECENT_TRACES} turns, all sessions. Full traces: `{get_tracer().path}`")
+            st.dataframe(import_report(), hide_index=True, use_container_width=True)
+            st.caption("First-import cost of lazily loaded dependencies in this process.")
         st.divider()
 
         ###---- Google Gemini Sidebar Customization----###
@@ -466,9 +757,16 @@ else:
                             key="camera_img",
                             on_change=add_camera_img_to_messages,
                         )
+            with st.popover("🖼️ Image Settings", use_container_width=True):
+                st.select_slider("Maximum image size (px):", options=[512, 768, 1024, 1536, 2048, 3072],
+                                 value=IMAGE_MAX_EDGE, key="image_max_edge")
+                st.slider("Image quality:", min_value=40, max_value=95, value=IMAGE_QUALITY, step=5, key="image_quality")
+                st.selectbox("Image format:", options=list(IMAGE_FORMATS), key="image_format")
+            with st.popover("🎙️ Audio Settings", use_container_width=True):
+                st.toggle("Trim silence and downsample", value=True, key="audio_preprocessing",
+                          help="WAV recordings and uploads are cut to the speech, mixed to mono and resampled to 16 kHz before upload.")
             st.divider()
-            tip = "If you upload a PDF or DOCX file, it will be sent to LLM."
-            pdf_upload = st.file_uploader("Upload a PDF or Docx file", type=["pdf", "docx"], key="pdf_docx_uploaded", on_change=add_pdf_docx_file_to_messages, help=tip)
+            show_document_uploader()
         
         ###---- Groq Models Sidebar Customization----###
         else:
@@ -482,16 +780,28 @@ else:
                 
                 summarize_button = st.button("Summarize", type="primary", use_container_width=True, key="summarize")
 
-            elif groq_llm_type == "Agent":
+            if groq_llm_type != "Summarizer":
+                show_document_uploader()
+
+            if groq_llm_type == "Agent":
                 st.session_state.selected_tools = st.multiselect("Select Tools for Agent", default=["Wikipedia", "ArXiv", "DuckDuckGo Search"],
                                        options=["Wikipedia", "ArXiv", "DuckDuckGo Search"])
+                st.toggle("Parallel tool prefetch", key="tool_prefetch",
+                          help="Query all selected tools at once when the question arrives, so the agent can use the results right away.")
+                tool_cache_stats = lazy_import("groq_models").get_tool_cache().stats()
+                st.caption(f"Tool cache: {tool_cache_stats['hits']} hits, {tool_cache_stats['misses']} misses "
+                           f"({tool_cache_stats['hit_rate']:.0%} hit rate)")
                 
 
 ###--- Session state variables ---###
-    session_keys = ["messages", "uploaded_files", "groq_chat_history"]
-    for key in session_keys:
-        if key not in st.session_state:
-            st.session_state[key] = []
+    if "uploaded_files" not in st.session_state:
+        st.session_state.uploaded_files = []
+
+    # Only the recent window of a resumed session is loaded, older turns are paged in on request
+    if "messages" not in st.session_state:
+        st.session_state.messages = load_history(get_session_id(), "google")
+    if "groq_chat_history" not in st.session_state:
+        st.session_state.groq_chat_history = load_history(get_session_id(), "groq")
 
     if "transcribed_text" not in st.session_state:
         st.session_state.transcribed_text = None
@@ -518,19 +828,7 @@ else:
             if audio_bytes and st.session_state.prev_speech_hash != hash(audio_bytes):
                 st.session_state.prev_speech_hash = hash(audio_bytes)
 
-                speech_base64 = base64.b64encode(audio_bytes).decode()
-                unique_id = random.randint(1000, 9999)
-
-                st.session_state.messages.append(
-                    {
-                        "role": "user",
-                        "content": [{
-                            "type": "speech_input",
-                            "speech_input": f"data:audio/wav;base64,{speech_base64}",
-                            "unique_name": f"temp_{unique_id}"
-                        }]
-                    }
-                )
+                add_audio_to_messages(audio_bytes, "audio/wav", "speech_input")
                 st.session_state.speech_file_added = True
 
         else:
@@ -551,31 +849,21 @@ else:
         if "pdf_docx_uploaded" not in st.session_state:
             st.session_state.pdf_docx_uploaded = None
 
-        if st.session_state.pdf_docx_uploaded:
-            if model_type == "google":
-                file_name = st.session_state.pdf_docx_uploaded.name
-                st.info(f"Your file :green['{file_name}'] has been uploaded!")
+        if st.session_state.get("documents"):
+            file_names = ", ".join(f"'{document['name']}'" for document in st.session_state.documents)
+            st.info(f"Your file(s) :green[{file_names}] will be searched for every question!")
 
 
     ####---DISPLAY CONVERSATION---###
     with chat_col2:
         message_container = st.container(height=400, border=False)
         if model_type == "google":
-            for message in st.session_state.messages:
-                valid_contents = [content for content in message["content"] if is_valid_content(content)]
-
-                if valid_contents:
-                    avatar = "assets/assistant.png" if message["role"] == "assistant" else "assets/user.png"
+            visible_messages, offset = with_older_turns(message_container, st.session_state.messages, visible_gemini_messages)
+            display_history(message_container, visible_messages, offset)
 
-                    with message_container.chat_message(message["role"], avatar=avatar):
-                        for content in valid_contents:
-                            render_content(content)
-                            
         if model_type == "groq":
-            for msg in st.session_state.groq_chat_history:
-                avatar = "assets/assistant.png" if msg["role"] == "assistant" else "assets/user.png"
-                with message_container.chat_message(msg["role"], avatar=avatar):
-                    st.markdown(msg['content'])
+            visible_messages, offset = with_older_turns(message_container, st.session_state.groq_chat_history, visible_groq_messages)
+            display_history(message_container, visible_messages, offset)
 
  ###---- Summarizer model------###
     if model_type == "groq" and groq_llm_type == "Summarizer":
@@ -587,12 +875,20 @@ else:
                     st.error("Please enter a valid URL")
                 else:
                     try:
-                        with st.spinner("Summarizing..."):
-                            final_response = summarizer_model(model_params=model_params, api_key=groq_api_key, url=url)
+                        with st.status("Summarizing...") as status:
+                            progress = st.progress(0.0)
+
+                            def show_summary_progress(stage, done, total):
+                                progress.progress(done / total, text=f"{stage}: {done}/{total}")
+
+                            with rate_limit_queue():
+                                final_response = lazy_import("groq_models").summarizer_model(model_params=model_params, api_key=groq_api_key, url=url,
+                                                                                             on_progress=show_summary_progress)
+                            status.update(label="Summary ready", state="complete", expanded=False)
                         st.markdown(final_response)
                         st.session_state.groq_chat_history.append({"role": "assistant", "content": final_response})
                     except Exception as e:
-                        st.error(f"An error occurred: {e}", icon="❌")
+                        st.error(f"An error occurred: {describe_error(e)}", icon="❌")
 
 ###----- User Question -----###
     else:
@@ -0,0 +1,134 @@
+import json
+import os
+import sys
+import tempfile
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Benchmarks never touch the real caches
+os.environ.setdefault("SUPER_AI_CACHE_DIR", tempfile.mkdtemp(prefix="super_ai_bench_"))
+
+from streamlit.testing.v1 import AppTest
+from blob_store import BlobStore
+from context_manager import ConversationContext
+from media_processing import preprocess_image, preprocess_audio
+from voice import synthesize_speech, audio_player_html
+from benchmarks.conversations import gemini_conversation, groq_conversation, camera_image, voice_recording, speech_recording, ANSWER
+from benchmarks.measure import measure, current_commit
+from benchmarks.offline import offline_services
+
+APP_PATH = os.path.join(ROOT, "app.py")
+FAKE_KEYS = {"groq": "gskBENCHMARK", "google": "AIzaBENCHMARK"}
+KEY_INPUTS = {"groq": 0, "google": 1}
+
+
+###--- Functions that can be called outside a script run ---###
+def function_benchmarks(turn_counts, repeat):
+    image, recording = camera_image(), voice_recording()
+
+    for name, data in [("camera_image", image), ("voice_recording", recording)]:
+        yield {"benchmark": "blob_put", "input": name, "bytes": len(data),
+               **measure(lambda store: store.put(data), setup=lambda: BlobStore(tempfile.mkdtemp()), repeat=repeat)}
+
+        def read_back(store):
+            with store.open(store.hash(data)) as f:
+                f.read()
+        # A store with no memory budget reads back from disk, as after a restart
+        yield {"benchmark": "blob_read", "input": name, "bytes": len(data),
+               **measure(read_back, setup=lambda: _stored(BlobStore(tempfile.mkdtemp(), memory_budget=0), data), repeat=repeat)}
+
+    # A large upload is spooled to disk in chunks; allocated_peak_kb stays bounded by the spool threshold
+    video = os.urandom(64 * 1024 * 1024)
+    yield {"benchmark": "blob_put_file", "input": "video_upload", "bytes": len(video),
+           **measure(lambda store: store.put_file(BytesIO(video)), setup=lambda: BlobStore(tempfile.mkdtemp()), repeat=repeat)}
+    del video
+
+    yield {"benchmark": "preprocess_image", "input": "camera_image", "bytes": len(image),
+           **measure(lambda _: preprocess_image(image), repeat=repeat)}
+
+    for name, data in [("speech_recording_44k_stereo", speech_recording()),
+                       ("speech_recording_48k_mono_long", speech_recording(speech_seconds=20, silence_seconds=3, rate=48000, channels=1))]:
+        processed = preprocess_audio(data)
+        yield {"benchmark": "preprocess_audio", "input": name, "bytes": len(data), "processed_bytes": len(processed),
+               "bytes_saved": len(data) - len(processed), **measure(lambda _: preprocess_audio(data), repeat=repeat)}
+
+    for chars in [200, 1000]:
+        text = (ANSWER * 3)[:chars]
+        yield {"benchmark": "voice_encoding", "chars": len(text),
+               **measure(lambda _: audio_player_html(synthesize_speech(text, "en-US-AvaNeural")), repeat=repeat)}
+
+    for turns in turn_counts:
+        messages = gemini_conversation(turns, media="mixed")
+        yield {"benchmark": "context_window", "turns": turns, "media": "mixed",
+               **measure(lambda _: ConversationContext().window(messages, "gemini-1.5-flash"), repeat=repeat)}
+
+
+def _stored(store, data):
+    store.put(data)
+    return store
+
+
+###--- Full script reruns through AppTest ---###
+def new_app(provider, state=None):
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.sidebar.text_input[KEY_INPUTS[provider]].input(FAKE_KEYS[provider]).run()
+    if provider == "groq":
+        at.sidebar.radio(key="groq_llm_type").set_value("Chatbot").run()
+    for key, value in (state or {}).items():
+        at.session_state[key] = value
+    return at
+
+
+def check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    # The app reports provider failures with st.error instead of raising
+    if at.error:
+        raise RuntimeError(at.error[0].value)
+
+
+def ask(at):
+    at.chat_input(key="question").set_value("What is the main idea? Explain briefly.").run()
+    check(at)
+    answer = at.chat_message[-1] if at.chat_message else None
+    if answer is None or answer.name != "assistant" or not any(m.value.strip() for m in answer.markdown):
+        raise RuntimeError("No assistant answer was rendered")
+
+
+def rerun(at):
+    at.run()
+    check(at)
+
+
+def rerun_benchmarks(turn_counts, repeat):
+    for turns in turn_counts:
+        for media in ["text", "mixed"]:
+            state = {"messages": gemini_conversation(turns, media)}
+            labels = {"turns": turns, "media": media}
+            yield {"benchmark": "rerun_history", "provider": "google", **labels,
+                   **measure(rerun, setup=lambda: new_app("google", state), repeat=repeat)}
+            # Includes messages_to_gemini (media uploads, part conversion) and streaming the answer
+            yield {"benchmark": "rerun_question", "provider": "google", **labels,
+                   **measure(ask, setup=lambda: new_app("google", state), repeat=repeat)}
+
+        state = {"groq_chat_history": groq_conversation(turns)}
+        yield {"benchmark": "rerun_question", "provider": "groq", "turns": turns, "media": "text",
+               **measure(ask, setup=lambda: new_app("groq", state), repeat=repeat)}
+
+
+def run(turn_counts=(10, 50, 200), repeat=5):
+    os.chdir(ROOT)  # assets are loaded relative to the repo root, as with `streamlit run app.py`
+    commit = current_commit()
+    with offline_services():
+        for result in function_benchmarks(turn_counts, repeat):
+            yield {"commit": commit, **result}
+        for result in rerun_benchmarks(turn_counts, repeat):
+            yield {"commit": commit, **result}
+
+
+if __name__ == "__main__":
+    quick = "--quick" in sys.argv
+    for result in run(turn_counts=(10, 50) if quick else (10, 50, 200), repeat=2 if quick else 5):
+        print(json.dumps(result), flush=True)
@@ -0,0 +1,55 @@
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SUPER_AI_CACHE_DIR", tempfile.mkdtemp(prefix="super_ai_bench_"))
+
+from hedging import hedged_stream
+
+
+###--- Model endpoints whose first token usually comes fast, with a slow tail ---###
+def slow_tail_stream(rng, median_seconds, tail_probability, tail_seconds, chunks=5):
+    def stream():
+        first_token = median_seconds * rng.lognormvariate(0, 0.25)
+        if rng.random() < tail_probability:
+            first_token += tail_seconds
+        time.sleep(first_token)
+        for _ in range(chunks):
+            yield "word "
+    return stream
+
+
+def first_token_seconds(stream):
+    start = time.perf_counter()
+    next(stream)
+    seconds = time.perf_counter() - start
+    stream.close()
+    return seconds
+
+
+def summarize(samples):
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {f"ttft_p{q}_ms": round(cuts[q - 1] * 1000, 1) for q in (50, 95, 99)}
+
+
+def run(requests=100, delay_ms=300, seed=0):
+    rng = random.Random(seed)
+    endpoint = {"median_seconds": 0.15, "tail_probability": 0.1, "tail_seconds": 1.5}
+
+    single = [first_token_seconds(slow_tail_stream(rng, **endpoint)()) for _ in range(requests)]
+    yield {"benchmark": "hedging", "mode": "single_model", "requests": requests, **summarize(single)}
+
+    hedged = [first_token_seconds(hedged_stream(slow_tail_stream(rng, **endpoint), slow_tail_stream(rng, **endpoint), delay_ms))
+              for _ in range(requests)]
+    yield {"benchmark": "hedging", "mode": "hedged", "delay_ms": delay_ms, "requests": requests, **summarize(hedged)}
+
+
+if __name__ == "__main__":
+    for result in run():
+        print(json.dumps(result))
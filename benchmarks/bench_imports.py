@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each scenario renders the app once in a fresh interpreter, so nothing is imported yet
+SCENARIO = """
+import json, sys, time, resource
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+at.sidebar.text_input[{key_input}].input("{api_key}").run()
+if {llm_type!r}:
+    at.sidebar.radio(key="groq_llm_type").set_value({llm_type!r}).run()
+from lazy_imports import import_report
+print(json.dumps({{
+    "seconds": round(time.perf_counter() - start, 3),
+    "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    "modules": len(sys.modules),
+    "lazy_imports": import_report(),
+}}))
+"""
+SCENARIOS = {
+    "google": {"key_input": 1, "api_key": "AIzaBENCHMARK", "llm_type": None},
+    "groq_chatbot": {"key_input": 0, "api_key": "gskBENCHMARK", "llm_type": "Chatbot"},
+    "groq_agent": {"key_input": 0, "api_key": "gskBENCHMARK", "llm_type": "Agent"},
+    "groq_summarizer": {"key_input": 0, "api_key": "gskBENCHMARK", "llm_type": "Summarizer"},
+}
+
+
+def slowest_imports(importtime_log, top=10):
+    """Top-level imports by cumulative time from `python -X importtime` output."""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            rows.append({"module": name.strip(), "seconds": int(cumulative) / 1e6})
+    return sorted(rows, key=lambda row: row["seconds"], reverse=True)[:top]
+
+
+def run(scenarios=SCENARIOS):
+    for name, params in scenarios.items():
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", SCENARIO.format(**params)],
+                                 cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        yield {"benchmark": "cold_start", "scenario": name, **result,
+               "slowest_imports": slowest_imports(process.stderr)}
+
+
+if __name__ == "__main__":
+    for result in run():
+        print(json.dumps(result))
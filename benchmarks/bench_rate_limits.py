@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("SUPER_AI_CACHE_DIR", tempfile.mkdtemp(prefix="super_ai_bench_"))
+
+import rate_limiter
+from rate_limiter import waiting_as
+from clients import get_groq_llm
+from benchmarks.conversations import ANSWER
+
+BENCH_MODEL = "bench-model"
+
+
+###--- Local stand-in for the Groq API: 429s with retry-after, then OpenAI-style completions ---###
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rejected_requests=3, retry_after=1):
+        super().__init__(("127.0.0.1", 0), FakeGroqHandler)
+        self.rejected_requests = rejected_requests
+        self.retry_after = retry_after
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        with self.server.lock:
+            self.server.requests += 1
+            rejected = self.server.requests <= self.server.rejected_requests
+
+        if rejected:
+            body = {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}}
+            self._send(429, body, {"retry-after": str(self.server.retry_after)})
+            return
+        self._send(200, {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": BENCH_MODEL,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 100, "total_tokens": 120},
+        })
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+###--- Concurrent sessions sharing one key ---###
+def run_sessions(server, calls_per_session, requests_per_minute):
+    rate_limiter.MODEL_RATE_LIMITS[BENCH_MODEL] = (requests_per_minute, 1_000_000)
+    api_key = f"gskBENCHMARK{time.time_ns()}"  # a fresh key gets a fresh scheduler
+    llm = get_groq_llm(api_key, BENCH_MODEL, 0, base_url=server.base_url)
+    # Start from an exhausted budget so every call has to queue
+    rate_limiter.get_rate_limiter().scheduler("groq", api_key, BENCH_MODEL).requests.level = 0
+    finished = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def session(name, calls):
+        with waiting_as(name):
+            for _ in range(calls):
+                sent = time.perf_counter()
+                llm.invoke("Hello")
+                with lock:
+                    finished.append({"session": name, "seconds": time.perf_counter() - sent})
+
+    with ThreadPoolExecutor(max_workers=len(calls_per_session)) as pool:
+        for future in [pool.submit(session, name, calls) for name, calls in calls_per_session.items()]:
+            future.result()
+
+    # Where each session's first answer landed among all answers; round-robin keeps light sessions near the front
+    first_answer = {name: next(i for i, row in enumerate(finished, start=1) if row["session"] == name) for name in calls_per_session}
+    waits = sorted(row["seconds"] for row in finished)
+    return {
+        "http_requests": server.requests,
+        "retries": server.requests - len(finished),
+        "total_seconds": round(time.perf_counter() - start, 3),
+        "wait_p50_seconds": round(waits[len(waits) // 2], 3),
+        "wait_max_seconds": round(waits[-1], 3),
+        "first_answer_position": first_answer,
+    }
+
+
+def run():
+    scenarios = [
+        ("retry_after_429", {"rejected_requests": 3, "retry_after": 1}, {"a": 1, "b": 1, "c": 1}, 600),
+        ("heavy_session_fairness", {"rejected_requests": 0}, {"heavy": 8, "light_1": 1, "light_2": 1}, 120),
+    ]
+    for name, server_params, calls_per_session, requests_per_minute in scenarios:
+        server = FakeGroqServer(**server_params)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            yield {"benchmark": "rate_limits", "scenario": name, "sessions": calls_per_session,
+                   "requests_per_minute": requests_per_minute, **run_sessions(server, calls_per_session, requests_per_minute)}
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    for result in run():
+        print(json.dumps(result))
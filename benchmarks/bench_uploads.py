@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_files import upload_files
+from benchmarks.fake_genai import FakeFileClient
+
+###--- Sequential 10 s polling (old behaviour) vs the concurrent pipeline ---###
+def sequential_upload(sources, client):
+    for file_hash, (path, mime_type) in sources.items():
+        file = client.upload_file(path=path, display_name=file_hash, mime_type=mime_type)
+        while file.state.name == "PROCESSING":
+            time.sleep(10)
+            file = client.get_file(file.name)
+
+
+def run(file_counts=(1, 3, 6), processing_seconds=1.5, include_sequential=False):
+    results = []
+    for count in file_counts:
+        sources = {f"hash_{i}": (f"file_{i}.mp4", "video/mp4") for i in range(count)}
+        modes = {"concurrent": lambda client: list(upload_files(sources, client=client))}
+        if include_sequential:
+            modes["sequential"] = lambda client: sequential_upload(sources, client)
+
+        for mode, upload in modes.items():
+            client = FakeFileClient(processing_seconds=processing_seconds)
+            start = time.perf_counter()
+            upload(client)
+            results.append({
+                "benchmark": "uploads",
+                "mode": mode,
+                "files": count,
+                "seconds": round(time.perf_counter() - start, 3),
+                **client.calls,
+            })
+    return results
+
+
+if __name__ == "__main__":
+    for result in run(include_sequential="--sequential" in sys.argv):
+        print(json.dumps(result))
@@ -0,0 +1,79 @@
+import io
+import math
+import struct
+import wave
+import numpy as np
+from PIL import Image
+from blob_store import get_blob_store
+
+QUESTION = "Can you explain how this works in a little more detail, with an example? "
+ANSWER = "Sure. Here is a detailed explanation with a short example that walks through each step. " * 4
+
+
+###--- Synthetic media, generated once per process ---###
+def camera_image(width=1920, height=1080):
+    output = io.BytesIO()
+    Image.effect_noise((width, height), 48).convert("RGB").save(output, format="PNG")
+    return output.getvalue()
+
+
+def voice_recording(seconds=3, rate=44100):
+    frames = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * i / rate))) for i in range(seconds * rate))
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    return output.getvalue()
+
+
+def speech_recording(speech_seconds=4, silence_seconds=3, rate=44100, channels=2, seed=0):
+    """A recorder-style WAV: room noise, a burst of speech-like harmonics, then the pause that stops the recording."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(speech_seconds * rate)) / rate
+    speech = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 8)) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    silence = np.zeros(int(silence_seconds * rate))
+    signal = np.concatenate([silence[:rate // 2], 0.25 * speech, silence]) + rng.normal(0, 0.002, int((speech_seconds + silence_seconds) * rate) + rate // 2)
+    frames = np.repeat((np.clip(signal, -1, 1) * 32767).astype("<i2")[:, None], channels, axis=1)
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(frames.tobytes())
+    return output.getvalue()
+
+
+def media_blobs():
+    blob_store = get_blob_store()
+    return {
+        "image_file": (blob_store.put(camera_image(800, 600)), "image/png"),
+        "speech_input": (blob_store.put(voice_recording()), "audio/wav"),
+    }
+
+
+###--- Conversations of a given length and media mix ---###
+def gemini_conversation(turns, media="text"):
+    """Alternating user/assistant messages; with media="mixed" every 4th question has an image and every 6th a voice note."""
+    blobs = media_blobs() if media == "mixed" else {}
+    messages = []
+    for turn in range(turns):
+        content = [{"type": "text", "text": f"{turn}. {QUESTION}"}]
+        if blobs and turn % 4 == 0:
+            blob, mime_type = blobs["image_file"]
+            content.insert(0, {"type": "image_file", "blob": blob, "mime_type": mime_type})
+        elif blobs and turn % 6 == 0:
+            blob, mime_type = blobs["speech_input"]
+            content.insert(0, {"type": "speech_input", "blob": blob, "mime_type": mime_type})
+        messages.append({"role": "user", "content": content})
+        messages.append({"role": "assistant", "content": [{"type": "text", "text": ANSWER}]})
+    return messages
+
+
+def groq_conversation(turns):
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"{turn}. {QUESTION}"})
+        history.append({"role": "assistant", "content": ANSWER})
+    return history
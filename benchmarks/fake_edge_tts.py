@@ -0,0 +1,19 @@
+import os
+
+# edge-tts produces roughly 3 KB of MP3 per second of speech, about 15 characters
+BYTES_PER_CHAR = 200
+CHUNK_BYTES = 4096
+
+
+###--- Offline stand-in for edge_tts.Communicate ---###
+class FakeCommunicate:
+    def __init__(self, text, voice, **kwargs):
+        self.text = text
+        self.voice = voice
+
+    async def stream(self):
+        remaining = len(self.text) * BYTES_PER_CHAR
+        while remaining > 0:
+            size = min(CHUNK_BYTES, remaining)
+            remaining -= size
+            yield {"type": "audio", "data": os.urandom(size)}
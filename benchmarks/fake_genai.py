@@ -0,0 +1,59 @@
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+###--- Offline stand-in for the genai Files API ---###
+class FakeFileClient:
+    def __init__(self, upload_seconds=0.2, processing_seconds=1.5):
+        self.upload_seconds = upload_seconds
+        self.processing_seconds = processing_seconds
+        self.calls = {"upload_file": 0, "get_file": 0}
+        self._files = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _file(self, name):
+        uploaded_at, display_name = self._files[name]
+        state = "PROCESSING" if time.monotonic() - uploaded_at < self.processing_seconds else "ACTIVE"
+        return SimpleNamespace(
+            name=name,
+            display_name=display_name,
+            uri=f"https://fake.invalid/{name}",
+            mime_type="video/mp4",
+            state=SimpleNamespace(name=state),
+            expiration_time=SimpleNamespace(timestamp=lambda: time.time() + 48 * 60 * 60),
+        )
+
+    def upload_file(self, path, display_name=None, mime_type=None):
+        time.sleep(self.upload_seconds)
+        with self._lock:
+            self.calls["upload_file"] += 1
+            name = f"files/{next(self._ids)}"
+            self._files[name] = (time.monotonic(), display_name)
+        return self._file(name)
+
+    def get_file(self, name):
+        with self._lock:
+            self.calls["get_file"] += 1
+        return self._file(name)
+
+
+###--- Offline stand-in for a GenerativeModel ---###
+class FakeGenerativeModel:
+    def __init__(self, answer="This is a fake Gemini answer. " * 8, chunk_chars=24, token_seconds=0.0):
+        self.answer = answer
+        self.chunk_chars = chunk_chars
+        self.token_seconds = token_seconds
+        self.calls = 0
+
+    def _stream(self):
+        for start in range(0, len(self.answer), self.chunk_chars):
+            time.sleep(self.token_seconds)
+            yield SimpleNamespace(text=self.answer[start:start + self.chunk_chars])
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._stream()
+        return SimpleNamespace(text=self.answer)
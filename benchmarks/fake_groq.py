@@ -0,0 +1,8 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+FAKE_ANSWER = "This is a fake Groq answer that is streamed back one character at a time. " * 3
+
+
+###--- Offline stand-in for ChatGroq, accepting the same constructor arguments ---###
+def FakeChatGroq(model=None, api_key=None, temperature=None, max_tokens=None, **kwargs):
+    return FakeListChatModel(responses=[FAKE_ANSWER])
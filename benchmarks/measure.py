@@ -0,0 +1,45 @@
+import resource
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+###--- Wall time over several runs, then one traced run for allocations ---###
+def measure(func, setup=None, repeat=5):
+    """Calls func(setup()) after one warm-up run; setup is not timed."""
+    setup = setup or (lambda: None)
+    func(setup())  # warm-up: imports, st.cache_* entries, pooled clients
+
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+
+    arg = setup()
+    tracemalloc.start()
+    func(arg)
+    allocated, allocated_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds_median": round(statistics.median(times), 5),
+        "seconds_min": round(min(times), 5),
+        "allocated_kb": round(allocated / 1024, 1),
+        "allocated_peak_kb": round(allocated_peak / 1024, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
@@ -0,0 +1,17 @@
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+from benchmarks.fake_genai import FakeFileClient, FakeGenerativeModel
+from benchmarks.fake_groq import FakeChatGroq
+from benchmarks.fake_edge_tts import FakeCommunicate
+
+
+###--- Replaces every network-bound client used by the app ---###
+@contextmanager
+def offline_services(upload_seconds=0.0, processing_seconds=0.0):
+    files = FakeFileClient(upload_seconds=upload_seconds, processing_seconds=processing_seconds)
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch("clients.get_gemini_file_client", lambda api_key: files))
+        stack.enter_context(mock.patch("clients.get_gemini_model", lambda **kwargs: FakeGenerativeModel()))
+        stack.enter_context(mock.patch("langchain_groq.ChatGroq", FakeChatGroq))
+        stack.enter_context(mock.patch("edge_tts.Communicate", FakeCommunicate))
+        yield files
@@ -0,0 +1,188 @@
+import streamlit as st
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from utils import get_cache_dir
+
+# Raw media bytes shared by every session of this process; messages only keep the hash
+MEMORY_BUDGET_BYTES = int(os.environ.get("BLOB_MEMORY_BUDGET_MB", 256)) * 1024 * 1024
+DISK_BUDGET_BYTES = int(os.environ.get("BLOB_DISK_BUDGET_MB", 4096)) * 1024 * 1024
+# Uploads larger than this are hashed and written to disk chunk by chunk instead of being copied into memory
+SPOOL_THRESHOLD_BYTES = 8 * 1024 * 1024
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# A temp file this old is orphaned even if its process is still alive
+ORPHAN_MAX_AGE_SECONDS = 60 * 60
+
+
+###--- Content-addressed, memory-bounded blob store that spills to disk ---###
+class BlobStore:
+    def __init__(self, directory, memory_budget=MEMORY_BUDGET_BYTES, disk_budget=DISK_BUDGET_BYTES):
+        self.directory = Path(directory)
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = sum(path.stat().st_size for path in self.directory.glob("*.blob"))
+        self._lock = threading.RLock()
+
+    def _path(self, blob_hash):
+        return self.directory / f"{blob_hash}.blob"
+
+    @staticmethod
+    def hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data):
+        blob_hash = self.hash(data)
+        with self._lock:
+            if blob_hash in self._memory:
+                self._memory.move_to_end(blob_hash)
+            elif not self._path(blob_hash).exists():
+                self._memory[blob_hash] = bytes(data)
+                self._memory_bytes += len(data)
+                self._evict_memory()
+        return blob_hash
+
+    def put_file(self, fileobj, chunk_size=SPOOL_CHUNK_BYTES):
+        """Stores a file object (e.g. a Streamlit upload) without holding a second full copy of it in memory."""
+        fileobj.seek(0)
+        head = fileobj.read(SPOOL_THRESHOLD_BYTES)
+        if len(head) < SPOOL_THRESHOLD_BYTES:
+            return self.put(head)
+
+        # The temp name carries the pid, so the janitor can tell a crashed writer from a live one
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f"spool.{os.getpid()}.", suffix=".tmp")
+        digest, size = hashlib.sha256(), 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                chunk = head
+                while chunk:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                    chunk = fileobj.read(chunk_size)
+            blob_hash = digest.hexdigest()
+            with self._lock:
+                path = self._path(blob_hash)
+                if path.exists():
+                    os.utime(path)
+                    os.unlink(temp_path)
+                else:
+                    os.replace(temp_path, path)
+                    self._disk_bytes += size
+                    self._evict_disk()
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        return blob_hash
+
+    def __contains__(self, blob_hash):
+        with self._lock:
+            return blob_hash in self._memory or self._path(blob_hash).exists()
+
+    def get(self, blob_hash):
+        """Returns a read-only memoryview of the blob, mmap-backed when it lives on disk."""
+        with self._lock:
+            if blob_hash in self._memory:
+                self._memory.move_to_end(blob_hash)
+                return memoryview(self._memory[blob_hash])
+
+        path = self._path(blob_hash)
+        if not path.exists():
+            raise KeyError(blob_hash)
+        os.utime(path)  # disk eviction is least-recently-used by mtime
+        if path.stat().st_size == 0:
+            return memoryview(b"")
+        with open(path, "rb") as f:
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def source(self, blob_hash):
+        # What st.image / st.video / st.audio and PIL can read without another copy
+        with self._lock:
+            if blob_hash in self._memory:
+                self._memory.move_to_end(blob_hash)
+                return self._memory[blob_hash]
+
+        path = self._path(blob_hash)
+        if not path.exists():
+            raise KeyError(blob_hash)
+        return path
+
+    def open(self, blob_hash):
+        source = self.source(blob_hash)
+        # BytesIO shares the buffer of a bytes object until it is written to
+        return BytesIO(source) if isinstance(source, bytes) else open(source, "rb")
+
+    def persist(self, blob_hash):
+        # Writes a blob through to disk (it stays in memory) so other processes and restarts can read it
+        with self._lock:
+            data = self._memory.get(blob_hash)
+            if data is not None:
+                self._spill(blob_hash, data)
+
+    def _evict_memory(self):
+        while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+            blob_hash, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            self._spill(blob_hash, data)
+
+    def _spill(self, blob_hash, data):
+        path = self._path(blob_hash)
+        if path.exists():
+            return
+        temp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self._disk_bytes += len(data)
+        self._evict_disk()
+
+    def reclaim_orphans(self, max_age=ORPHAN_MAX_AGE_SECONDS):
+        """Deletes temp files left behind by writers that crashed or were killed mid-write; returns bytes reclaimed."""
+        reclaimed = 0
+        for path in self.directory.glob("*.tmp"):
+            try:
+                stat = path.stat()
+                pid = int(path.name.split(".")[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if time.time() - stat.st_mtime < max_age and process_alive(pid):
+                continue
+            path.unlink(missing_ok=True)
+            reclaimed += stat.st_size
+        return reclaimed
+
+    def _evict_disk(self):
+        if self._disk_bytes <= self.disk_budget:
+            return
+        self.reclaim_orphans()
+        blobs = sorted(self.directory.glob("*.blob"), key=lambda path: path.stat().st_mtime)
+        for path in blobs:
+            if self._disk_bytes <= self.disk_budget:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            self._disk_bytes -= size
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # alive, owned by another user
+    return True
+
+
+@st.cache_resource
+def get_blob_store():
+    store = BlobStore(get_cache_dir("blobs"))
+    store.reclaim_orphans()
+    return store
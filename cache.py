@@ -0,0 +1,124 @@
+from collections import OrderedDict
+import json
+import sqlite3
+import threading
+import time
+
+
+###--- In-memory LRU cache with per-entry TTL and an optional SQLite tier ---###
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=60 * 60, disk_path=None, disk_max_bytes=256 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, timeout=30)
+            with self._disk:
+                self._disk.execute("PRAGMA journal_mode=WAL")
+                # Values are stored as JSON (or raw bytes) and never unpickled: the file may sit in a shared directory
+                self._disk.execute("DROP TABLE IF EXISTS cache")
+                self._disk.execute("""
+                    CREATE TABLE IF NOT EXISTS entries (
+                        key TEXT PRIMARY KEY,
+                        value TEXT,
+                        data BLOB,
+                        size INTEGER NOT NULL,
+                        expires_at REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                """)
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+            value = self._disk_get(key, now)
+            if value is not None:
+                self._memory_set(key, value[1], value[0])
+                self.hits += 1
+                return value[1]
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._memory_set(key, value, expires_at)
+            self._disk_set(key, value, expires_at)
+
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._memory),
+        }
+
+    def _memory_set(self, key, value, expires_at):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        if self._disk is None:
+            return None
+        row = self._disk.execute("SELECT value, data, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[2] <= now:
+            with self._disk:
+                self._disk.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        with self._disk:
+            self._disk.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+        return row[2], bytes(row[1]) if row[1] is not None else json.loads(row[0])
+
+    def _disk_set(self, key, value, expires_at):
+        if self._disk is None:
+            return
+        # Cached values are text, dicts of text or audio bytes
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            text, data = None, bytes(value)
+        else:
+            text, data = json.dumps(value), None
+        with self._disk:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, data, len(data if text is None else text), expires_at, time.time()),
+            )
+            self._prune_disk()
+
+    def _prune_disk(self):
+        self._disk.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        total = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        # Drop least recently used rows until the tier fits its budget again
+        for key, size in self._disk.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.disk_max_bytes:
+                break
+            self._disk.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
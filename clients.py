@@ -0,0 +1,110 @@
+import streamlit as st
+from lazy_imports import lazy_import
+from rate_limiter import get_rate_limiter, http_event_hooks, RETRY_ATTEMPTS
+from utils import key_fingerprint
+import threading
+import time
+
+# Clients unused for this long are dropped together with their connection pools
+IDLE_TIMEOUT_SECONDS = 15 * 60
+
+
+###--- Process-wide pool of LLM clients shared by all sessions ---###
+class ClientPool:
+    def __init__(self, idle_timeout=IDLE_TIMEOUT_SECONDS):
+        self.idle_timeout = idle_timeout
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory, close=None):
+        """Returns the pooled client for `key`; `close(client)` releases its connections once it is evicted."""
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = self._clients[key] = {"client": factory(), "last_used": now, "close": close}
+            entry["last_used"] = now
+            client = entry["client"]
+        for entry in evicted:
+            if entry["close"]:
+                entry["close"](entry["client"])
+        return client
+
+    def _evict_idle(self, now):
+        keys = [key for key, entry in self._clients.items() if now - entry["last_used"] > self.idle_timeout]
+        return [self._clients.pop(key) for key in keys]
+
+    def __len__(self):
+        return len(self._clients)
+
+
+@st.cache_resource
+def get_client_pool():
+    return ClientPool()
+
+
+def get_groq_llm(api_key, model, temperature, max_tokens=None, **kwargs):
+    # Provider SDKs are only imported once a model of that provider is used
+    ChatGroq = lazy_import("langchain_groq").ChatGroq
+    httpx = lazy_import("httpx")
+    key = ("groq", key_fingerprint(api_key), model, temperature, max_tokens, tuple(sorted(kwargs.items())))
+    # Every call queues on the shared per-key scheduler; the SDK retries 429/5xx with jittered backoff
+    scheduler = get_rate_limiter().scheduler("groq", api_key, model)
+    rate_limit = lazy_import("langchain_rate_limits").RateLimitCallbackHandler(scheduler, max_tokens)
+    kwargs = {"max_retries": RETRY_ATTEMPTS - 1, **kwargs}
+    return get_client_pool().get(
+        key,
+        lambda: ChatGroq(model=model, api_key=api_key, temperature=temperature, max_tokens=max_tokens, callbacks=[rate_limit],
+                         http_client=httpx.Client(timeout=httpx.Timeout(60, connect=5), event_hooks=http_event_hooks(scheduler)),
+                         **kwargs),
+        close=lambda llm: llm.http_client.close(),
+    )
+
+
+def get_gemini_model(api_key, model, temperature, max_tokens, safety_settings, system_instruction):
+    glm = lazy_import("google.ai.generativelanguage")
+    genai = lazy_import("google.generativeai")
+    pool = get_client_pool()
+    # One gRPC channel per key, shared by every model and parameter combination using that key
+    transport = pool.get(
+        ("google-transport", key_fingerprint(api_key)),
+        lambda: glm.GenerativeServiceClient(client_options={"api_key": api_key}),
+        close=lambda client: client.transport.close(),
+    )
+
+    def create_model():
+        gemini_model = genai.GenerativeModel(
+            model_name=model,
+            generation_config={"temperature": temperature, "max_output_tokens": max_tokens},
+            safety_settings=safety_settings,
+            system_instruction=system_instruction,
+        )
+        # Bypass the global client that genai.configure would rebuild for every session
+        gemini_model._client = transport
+        return gemini_model
+
+    return pool.get(("google", key_fingerprint(api_key), model, temperature, max_tokens, system_instruction), create_model)
+
+
+###--- upload_file / get_file of google.generativeai, bound to one key instead of the global client ---###
+class GeminiFileClient:
+    def __init__(self, api_key):
+        # genai's subclass of the gRPC client adds the resumable media upload
+        self._client = lazy_import("google.generativeai.client").FileServiceClient(client_options={"api_key": api_key})
+        self._file = lazy_import("google.generativeai.types.file_types").File
+
+    def upload_file(self, path, display_name=None, mime_type=None):
+        return self._file(self._client.create_file(path=path, mime_type=mime_type, display_name=display_name))
+
+    def get_file(self, name):
+        return self._file(self._client.get_file(name=name))
+
+    def close(self):
+        self._client.transport.close()
+
+
+def get_gemini_file_client(api_key):
+    # Uploads land in the project of the session's own key, whatever key other sessions use
+    return get_client_pool().get(("google-files", key_fingerprint(api_key)), lambda: GeminiFileClient(api_key),
+                                 close=GeminiFileClient.close)
@@ -0,0 +1,125 @@
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from tracing import span
+import threading
+
+CONTEXT_TOKEN_BUDGET = 3000
+SUMMARY_MAX_TOKENS = 400
+
+# Rough characters-per-token of each model family's tokenizer, good enough for budgeting
+CHARS_PER_TOKEN = {"llama": 4.0, "gemma": 4.0, "mixtral": 3.5, "gemini": 4.0}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+# Gemini bills media by duration/size; these are typical values for chat-sized uploads
+MEDIA_TOKENS = {"image_file": 258, "speech_input": 500, "audio_file": 1500, "video_file": 4000}
+MEDIA_LABELS = {"image_file": "[image]", "speech_input": "[voice message]", "audio_file": "[audio]", "video_file": "[video]"}
+
+SUMMARY_PROMPT = """Below is the running summary of a conversation between a user and an assistant,
+followed by the turns that happened after it. Write an updated summary in at most {max_words} words that keeps
+every fact, name, number, decision and open question the assistant may need later.
+
+Running summary:
+{summary}
+
+New turns:
+{transcript}
+
+Updated summary:"""
+
+
+def count_tokens(text, model):
+    ratio = next((value for family, value in CHARS_PER_TOKEN.items() if model.startswith(family)), DEFAULT_CHARS_PER_TOKEN)
+    return int(len(text) / ratio) + 1
+
+
+def message_tokens(message, model):
+    # Groq history stores plain strings, Gemini messages store a list of typed contents
+    if isinstance(message["content"], str):
+        return count_tokens(message["content"], model) + 4
+    return 4 + sum(
+        count_tokens(content["text"], model) if content["type"] == "text"
+        else MEDIA_TOKENS.get(content["type"], 0)
+        for content in message["content"]
+    )
+
+
+def message_text(message):
+    if isinstance(message["content"], str):
+        text = message["content"]
+    else:
+        text = " ".join(content["text"] if content["type"] == "text"
+                        else MEDIA_LABELS.get(content["type"], "")
+                        for content in message["content"])
+    return f"{message['role']}: {text}"
+
+
+def summary_prompt(summary, messages):
+    return SUMMARY_PROMPT.format(max_words=int(SUMMARY_MAX_TOKENS * 0.75),
+                                 summary=summary or "(empty)",
+                                 transcript="\n".join(message_text(message) for message in messages))
+
+
+@st.cache_resource
+def get_summary_executor():
+    # Summaries are folded off the request path; one process-wide pool for all sessions
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-summary")
+
+
+###--- Sliding window of recent turns plus a rolling summary of everything older ---###
+class ConversationContext:
+    def __init__(self):
+        self.summary = ""
+        self.summarized_upto = 0
+        self._future = None
+        self._lock = threading.Lock()
+
+    def window(self, messages, model, budget=CONTEXT_TOKEN_BUDGET):
+        """Returns (summary, start) so that summary + messages[start:] fit the token budget.
+
+        Turns that are not in the summary yet stay in the window until they are folded in, even past the budget.
+        """
+        with self._lock:
+            summary, summarized_upto = self.summary, self.summarized_upto
+        return summary, min(self._fit(summary, messages, model, budget), summarized_upto)
+
+    def _fit(self, summary, messages, model, budget):
+        # The current user turn (every message since the last answer, e.g. a video and the question about it)
+        # is always kept, even when it alone exceeds the budget; media is never dropped before it was answered
+        required = len(messages) - 1
+        while required > 0 and messages[required - 1]["role"] != "assistant" and messages[required]["role"] != "assistant":
+            required -= 1
+
+        used = count_tokens(summary, model)
+        start = len(messages)
+        while start > 0:
+            tokens = message_tokens(messages[start - 1], model)
+            if start <= required and used + tokens > budget:
+                break
+            used += tokens
+            start -= 1
+        return start
+
+    def fold_in_background(self, messages, model, summarize, budget=CONTEXT_TOKEN_BUDGET):
+        # Messages that no longer fit the budget are folded into the summary by a worker thread
+        with self._lock:
+            start = self._fit(self.summary, messages, model, budget)
+            if start <= self.summarized_upto or (self._future and not self._future.done()):
+                return
+            previous, folded = self.summary, list(messages[self.summarized_upto:start])
+            self._future = get_summary_executor().submit(self._fold, previous, folded, start, summarize)
+
+    def _fold(self, previous, folded, start, summarize):
+        try:
+            # A failed fold is recorded in the traces; the turns stay in the window and are retried after the next turn
+            with span("context.fold", messages=len(folded)):
+                summary = summarize(summary_prompt(previous, folded))
+        except Exception:
+            return
+        with self._lock:
+            self.summary = summary.strip()
+            self.summarized_upto = start
+
+
+def get_conversation_context(name):
+    if "conversation_contexts" not in st.session_state:
+        st.session_state.conversation_contexts = {}
+    return st.session_state.conversation_contexts.setdefault(name, ConversationContext())
@@ -0,0 +1,141 @@
+import streamlit as st
+from blob_store import get_blob_store
+from utils import get_cache_dir
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+CONVERSATION_DB = os.environ.get("CONVERSATION_DB") or os.path.join(get_cache_dir(), "conversations.sqlite3")
+CONVERSATION_RETENTION_DAYS = int(os.environ.get("CONVERSATION_RETENTION_DAYS", 30))
+# Turns loaded into memory when a session is resumed; older turns are paged in on request
+RECENT_TURNS = 50
+PAGE_TURNS = 20
+
+
+###--- Append-only turns of every session, shared by all worker processes ---###
+class ConversationStore:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        # Other Streamlit workers write to the same file; wait for their transactions instead of failing
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS turns (
+                    session_id TEXT NOT NULL,
+                    conversation TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, conversation, seq)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def append(self, session_id, conversation, role, content):
+        """Appends one turn and returns its sequence number within the conversation."""
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two tabs of one session can't pick the same seq
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq) + 1, 0) FROM turns WHERE session_id = ? AND conversation = ?",
+                    (session_id, conversation),
+                ).fetchone()[0]
+                self._conn.execute("INSERT INTO turns VALUES (?, ?, ?, ?, ?, ?)",
+                                   (session_id, conversation, seq, role, json.dumps(content), now))
+                # Sessions are only recorded once they have a turn, visitors who never ask cost nothing
+                self._conn.execute("INSERT INTO sessions VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at",
+                                   (session_id, now, now))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return seq
+
+    def turns(self, session_id, conversation, before=None, limit=RECENT_TURNS):
+        """Returns (first_seq, messages) for up to `limit` turns before seq `before` (default: the latest)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, role, content FROM turns WHERE session_id = ? AND conversation = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (session_id, conversation, before if before is not None else 2 ** 62, limit),
+            ).fetchall()
+        rows.reverse()
+        first_seq = rows[0][0] if rows else (before or 0)
+        return first_seq, [{"role": role, "content": json.loads(content)} for _, role, content in rows]
+
+    def prune(self, max_age_days=CONVERSATION_RETENTION_DAYS):
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM turns WHERE session_id IN (SELECT id FROM sessions WHERE updated_at < ?)", (cutoff,))
+                self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+@st.cache_resource
+def get_conversation_store():
+    store = ConversationStore(CONVERSATION_DB)
+    store.prune()
+    return store
+
+
+###--- In-memory window of a stored conversation; appends are written through ---###
+class PersistentHistory(list):
+    def __init__(self, store, session_id, conversation, messages=(), first_seq=0):
+        super().__init__(messages)
+        self.store = store
+        self.session_id = session_id
+        self.conversation = conversation
+        self.first_seq = first_seq  # seq of self[0]; earlier turns stay in the database
+        self.older = []  # turns paged in for display only, never sent to the model
+        self.older_first_seq = first_seq  # seq of self.older[0]
+
+    def append(self, message):
+        # Media must outlive this process's memory budget, or a resumed session would lose it
+        if not isinstance(message["content"], str):
+            for content in message["content"]:
+                if "blob" in content:
+                    get_blob_store().persist(content["blob"])
+        self.store.append(self.session_id, self.conversation, message["role"], message["content"])
+        super().append(message)
+
+    def has_older(self):
+        return self.older_first_seq > 0
+
+    def load_older(self, limit=PAGE_TURNS):
+        first_seq, messages = self.store.turns(self.session_id, self.conversation, before=self.older_first_seq, limit=limit)
+        self.older_first_seq = first_seq if messages else 0
+        self.older[:0] = messages
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def is_session_id(value):
+    return isinstance(value, str) and len(value) == 32 and all(char in "0123456789abcdef" for char in value)
+
+
+def load_history(session_id, conversation):
+    store = get_conversation_store()
+    first_seq, messages = store.turns(session_id, conversation)
+    return PersistentHistory(store, session_id, conversation, messages, first_seq)
@@ -0,0 +1,81 @@
+import streamlit as st
+from collections import Counter
+from io import BytesIO
+import math
+import re
+from blob_store import get_blob_store
+from lazy_imports import lazy_import
+
+CHUNK_CHARS = 1000
+CHUNK_OVERLAP_CHARS = 150
+TOP_K_CHUNKS = 4
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+###--- Text extraction ---###
+def extract_text(data, mime_type):
+    if mime_type == "application/pdf":
+        reader = lazy_import("pypdf").PdfReader(BytesIO(data))
+        return "\n\n".join(page.extract_text() or "" for page in reader.pages)
+
+    doc = lazy_import("docx").Document(BytesIO(data))
+    return "\n".join(para.text for para in doc.paragraphs)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+###--- Okapi BM25 over the chunks of one document ---###
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = sum(self.lengths) / len(chunks) if chunks else 0
+
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        self.idf = {
+            term: math.log(1 + (len(chunks) - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def score(self, query_terms, index):
+        counts, length = self.term_counts[index], self.lengths[index]
+        score = 0.0
+        for term in query_terms:
+            frequency = counts.get(term)
+            if frequency:
+                norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+                score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+        return score
+
+    def search(self, query, k=TOP_K_CHUNKS):
+        query_terms = set(tokenize(query))
+        scored = [(self.score(query_terms, index), index) for index in range(len(self.chunks))]
+        return [(score, self.chunks[index]) for score, index in sorted(scored, reverse=True)[:k] if score > 0]
+
+
+@st.cache_resource(max_entries=64, show_spinner="Indexing your document...")
+def get_document_index(blob_hash, mime_type):
+    # Built once per document content, whoever uploads it
+    text = extract_text(bytes(get_blob_store().get(blob_hash)), mime_type)
+    splitter = lazy_import("langchain_text_splitters").RecursiveCharacterTextSplitter(chunk_size=CHUNK_CHARS, chunk_overlap=CHUNK_OVERLAP_CHARS)
+    return BM25Index(splitter.split_text(text))
+
+
+def retrieve_excerpts(documents, question, k=TOP_K_CHUNKS):
+    results = []
+    for document in documents:
+        index = get_document_index(document["blob"], document["mime_type"])
+        hits = index.search(question, k)
+        # BM25 scores use each document's own IDF, so they are compared relative to the document's best match
+        results.extend((score / hits[0][0], document["name"], chunk) for score, chunk in hits)
+
+    results.sort(key=lambda result: result[0], reverse=True)
+    if not results:
+        return ""
+    excerpts = "\n\n".join(f"[{name}]\n{chunk}" for _, name, chunk in results[:k])
+    return f"Relevant excerpts from the uploaded documents:\n\n{excerpts}"
@@ -0,0 +1,132 @@
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import sqlite3
+import threading
+import time
+from utils import get_cache_dir
+from tracing import span, in_current_context
+
+# Gemini keeps uploaded files for 48 hours; stop reusing a handle a bit before it disappears
+EXPIRY_MARGIN_SECONDS = 60 * 60
+
+# Short clips are usually ACTIVE within a second, long videos take minutes
+POLL_INITIAL_SECONDS = 0.5
+POLL_MAX_SECONDS = 8
+UPLOAD_WORKERS = 4
+
+
+###--- Local registry of files already uploaded to Gemini ---###
+class FileRegistry:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS gemini_files (
+                    content_hash TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    uri TEXT NOT NULL,
+                    mime_type TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (content_hash, owner)
+                )
+            """)
+
+    def get(self, file_hash, owner):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, uri, mime_type, state, expires_at FROM gemini_files WHERE content_hash = ? AND owner = ?",
+                (file_hash, owner),
+            ).fetchone()
+        if row is None:
+            return None
+
+        record = dict(zip(["name", "uri", "mime_type", "state", "expires_at"], row))
+        if record["expires_at"] - EXPIRY_MARGIN_SECONDS <= time.time():
+            self.evict_expired()
+            return None
+        return record
+
+    def put(self, file_hash, owner, file):
+        record = {
+            "name": file.name,
+            "uri": file.uri,
+            "mime_type": file.mime_type,
+            "state": file.state.name,
+            "expires_at": file.expiration_time.timestamp(),
+        }
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gemini_files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_hash, owner, record["name"], record["uri"], record["mime_type"], record["state"], record["expires_at"]),
+            )
+        return record
+
+    def evict_expired(self):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM gemini_files WHERE expires_at - ? <= ?",
+                (EXPIRY_MARGIN_SECONDS, time.time()),
+            )
+
+
+@st.cache_resource
+def get_file_registry():
+    registry = FileRegistry(os.path.join(get_cache_dir(), "gemini_files.sqlite3"))
+    registry.evict_expired()
+    return registry
+
+
+def file_part(record):
+    # Referencing the file by URI needs no extra round trip to the Files API
+    return {"file_data": {"mime_type": record["mime_type"], "file_uri": record["uri"]}}
+
+
+###--- Concurrent upload pipeline ---###
+def wait_until_active(file, client, sleep=time.sleep):
+    delay = POLL_INITIAL_SECONDS
+    while file.state.name == "PROCESSING":
+        sleep(delay)
+        delay = min(delay * 2, POLL_MAX_SECONDS)
+        file = client.get_file(file.name)
+
+    if file.state.name == "FAILED":
+        raise ValueError(f"Gemini could not process {file.display_name}: {file.state.name}")
+    return file
+
+
+def source_size(source):
+    """Size in bytes for the upload span, or None when the source cannot be stat'ed."""
+    try:
+        if isinstance(source, (str, os.PathLike)):
+            return os.path.getsize(source)
+        if hasattr(source, "getbuffer"):
+            return source.getbuffer().nbytes
+        return os.fstat(source.fileno()).st_size
+    except (OSError, AttributeError, ValueError):
+        return None
+
+
+def upload_and_activate(source, display_name, mime_type, client):
+    size = source_size(source)
+    with span("gemini.upload_file", mime_type=mime_type, **({} if size is None else {"bytes": size})):
+        file = client.upload_file(path=source, display_name=display_name, mime_type=mime_type)
+        with span("gemini.processing_wait"):
+            return wait_until_active(file, client)
+
+
+def upload_files(sources, client):
+    """Uploads {file_hash: (path_or_file, mime_type)} concurrently and yields (file_hash, file) as each one becomes ACTIVE."""
+    if not sources:
+        return
+
+    with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(sources))) as pool:
+        futures = {
+            pool.submit(in_current_context(upload_and_activate), source, file_hash, mime_type, client): file_hash
+            for file_hash, (source, mime_type) in sources.items()
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
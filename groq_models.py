@@ -1,18 +1,26 @@
-from langchain_groq import ChatGroq
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
-from langchain_community.document_loaders import YoutubeLoader, WebBaseLoader
-from langchain.chains.summarize import load_summarize_chain
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import Tool
-from langchain_community.tools import DuckDuckGoSearchRun
-from langchain.agents import create_react_agent
-from langchain.agents import AgentExecutor
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
-from langchain_community.utilities import WikipediaAPIWrapper, ArxivAPIWrapper
 import streamlit as st
+from clients import get_groq_llm
+from cache import TTLCache
+from context_manager import SUMMARY_MAX_TOKENS
+from hedging import hedged_stream
+from response_cache import is_cacheable, response_cache_key, cached_stream
+from tracing import span, in_current_context
+from langchain_tracing import TracingCallbackHandler
+from lazy_imports import lazy_import
+from rate_limiter import report_waits, WAIT_POLL_SECONDS
+from utils import get_cache_dir
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import queue
+import threading
 
-def groq_chatbot(model_params, question, api_key, chat_history):
-    llm = ChatGroq(model=model_params['model'], api_key=api_key,
+def groq_chatbot(model_params, question, api_key, chat_history, document_excerpts=""):
+    llm = get_groq_llm(api_key=api_key, model=model_params['model'],
                 temperature=model_params["temperature"],
                 max_tokens=model_params['max_tokens']
                 )
@@ -22,16 +30,39 @@ def groq_chatbot(model_params, question, api_key, chat_history):
     which might reference context in the chat history, 
     Answer the user question in a polite and professional manner."""
 )   
+    # Excerpts of the user's documents are context for this question only, never part of the question itself
+    excerpts = [("system", "{document_excerpts}")] if document_excerpts else []
     prompt = ChatPromptTemplate.from_messages(
     [
         ("system", system_template),
         MessagesPlaceholder(variable_name="chat_history"),
+        *excerpts,
         ("user", "Questioin: {question}")
     ]
 )
+    inputs = {"question": question, "chat_history": chat_history, "document_excerpts": document_excerpts}
     chain = prompt | llm | StrOutputParser()
+    stream = partial(chain.stream, inputs, {"callbacks": [TracingCallbackHandler()]})
 
-    return chain.stream({"question": question, "chat_history": chat_history})
+    model = model_params["model"]
+    if model_params.get("hedge_model"):
+        # Fast mode: the same prompt to a second model if the first one is slow to start
+        backup_llm = get_groq_llm(api_key=api_key, model=model_params["hedge_model"],
+                                  temperature=model_params["temperature"], max_tokens=model_params["max_tokens"])
+        backup = partial((prompt | backup_llm | StrOutputParser()).stream, inputs, {"callbacks": [TracingCallbackHandler()]})
+        stream = partial(hedged_stream, stream, backup, model_params["hedge_delay_ms"], (model, model_params["hedge_model"]))
+        model = f"{model}|{model_params['hedge_model']}"
+
+    if not is_cacheable(model_params["temperature"]):
+        return stream()
+    key = response_cache_key(model, model_params["temperature"], model_params["max_tokens"],
+                             system_template + document_excerpts, chat_history, question)
+    return cached_stream(key, stream)
+
+
+def summarize_conversation(api_key, model, prompt):
+    llm = get_groq_llm(api_key=api_key, model=model, temperature=0, max_tokens=SUMMARY_MAX_TOKENS)
+    return llm.invoke(prompt).content
 
 
 def get_prompt():
@@ -57,6 +88,8 @@ Begin!
                                               
 Previous conversation history:
 {chat_history}
+{document_excerpts}
+{prefetched_observations}
 New input: {input}
 
 {agent_scratchpad}
@@ -64,72 +97,211 @@ New input: {input}
     return prompt
 
 
-def create_groq_agent(model_params, api_key, tools, question, chat_history):
+def prefetch_tool(tool, question):
+    with span(f"tool.{tool.name}", prefetch=True, input_chars=len(question)) as active:
+        result = tool.func(question)
+        active.set(output_chars=len(result))
+        return result
+
+
+def prefetch_tool_results(tools, question):
+    # Every selected tool is queried with the question at once; results land in the tool cache too
+    observations = {}
+    with ThreadPoolExecutor(max_workers=len(tools)) as pool:
+        futures = {pool.submit(in_current_context(prefetch_tool), tool, question): tool.name for tool in tools}
+        for future in as_completed(futures):
+            try:
+                observations[futures[future]] = future.result()
+            except Exception:
+                continue  # the agent can still call the tool itself
+    return observations
+
 
-    llm = ChatGroq(model=model_params['model'], api_key=api_key,
+def format_prefetched_observations(observations):
+    if not observations:
+        return ""
+    results = "\n".join(f"{tool_name}: {result}" for tool_name, result in observations.items())
+    return f"""Tool results already retrieved for the new input (use them before calling a tool again):
+{results}
+"""
+
+
+def create_groq_agent(model_params, api_key, tools, question, chat_history, prefetch=False, document_excerpts=""):
+
+    llm = get_groq_llm(api_key=api_key, model=model_params['model'],
                     temperature=model_params["temperature"],
                     )
     prompt = get_prompt()
+    # Tools (third-party search engines) only ever see the user's question, not their documents
+    observations = prefetch_tool_results(tools, question) if prefetch and tools else {}
 
-    agent = create_react_agent(llm, tools, prompt)
+    # The agent stack is only imported once Agent mode is actually used
+    agents = lazy_import("langchain.agents")
+    agent = agents.create_react_agent(llm, tools, prompt)
     
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True, max_iterations=7)
-    st_callback = StreamlitCallbackHandler(st.container())
+    agent_executor = agents.AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True, max_iterations=7)
+    st_callback = lazy_import("langchain_community.callbacks.streamlit").StreamlitCallbackHandler(st.container())
+
+    return AgentAnswer(agent_executor, {"input":question, "chat_history":chat_history, "document_excerpts": document_excerpts,
+                                        "prefetched_observations": format_prefetched_observations(observations)},
+                       [st_callback, TracingCallbackHandler()])
+
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+
+###--- Tokens the agent's LLM writes after "Final Answer:", pushed to a queue as they arrive ---###
+class FinalAnswerCallbackHandler(BaseCallbackHandler):
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self._buffers = {}  # run_id -> text so far, until the marker shows up
+        self._streaming = {}  # run_id -> whether the first non-blank token was sent
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._buffers[run_id] = ""
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if run_id in self._buffers:
+            # The marker can be split across tokens
+            buffer = self._buffers[run_id] + token
+            if FINAL_ANSWER_MARKER not in buffer:
+                self._buffers[run_id] = buffer
+                return
+            del self._buffers[run_id]
+            self._streaming[run_id] = False
+            token = buffer.split(FINAL_ANSWER_MARKER, 1)[1]
+
+        if run_id in self._streaming:
+            if not self._streaming[run_id]:
+                token = token.lstrip()
+                self._streaming[run_id] = bool(token)
+            if token:
+                self.tokens.put(token)
+
+
+###--- Runs the agent in a worker thread and streams its final answer ---###
+class AgentAnswer:
+    def __init__(self, agent_executor, inputs, callbacks):
+        self.agent_executor = agent_executor
+        self.inputs = inputs
+        self.callbacks = callbacks
+        self.output = None
+
+    def __iter__(self):
+        tokens, result = queue.Queue(), {}
+
+        def run():
+            try:
+                result["output"] = self.agent_executor.invoke(
+                    self.inputs, {"callbacks": [*self.callbacks, FinalAnswerCallbackHandler(tokens)]})["output"]
+            except Exception as e:
+                result["error"] = e
+            finally:
+                tokens.put(None)
 
-    response = agent_executor.invoke({"input":question, "chat_history":chat_history}, {"callbacks": [st_callback]})
-    return response['output']
+        thread = threading.Thread(target=in_current_context(run), daemon=True)
+        # The StreamlitCallbackHandler draws the agent's steps from the worker thread
+        script_runner = lazy_import("streamlit.runtime.scriptrunner")
+        script_runner.add_script_run_ctx(thread, script_runner.get_script_run_ctx())
+        thread.start()
+
+        streamed = []
+        while True:
+            try:
+                token = tokens.get(timeout=WAIT_POLL_SECONDS)
+            except queue.Empty:
+                # The agent's LLM calls queue on the worker thread, their positions are shown from here
+                report_waits()
+                continue
+            if token is None:
+                break
+            streamed.append(token)
+            yield token
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+
+        self.output = result["output"]
+        if not streamed:
+            # Stopped without a final answer (iteration limit), nothing was streamed
+            yield self.output
+
+
+# Tool results go stale at different speeds, web search results the fastest
+TOOL_CACHE_TTLS = {
+    "Wikipedia": 24 * 60 * 60,
+    "ArXiv": 12 * 60 * 60,
+    "DuckDuckGo Search": 15 * 60,
+}
+
+
+@st.cache_resource
+def get_tool_cache():
+    disk_path = None
+    if os.environ.get("TOOL_CACHE_ON_DISK", "1") == "1":
+        disk_path = os.path.join(get_cache_dir(), "tool_results.sqlite3")
+    return TTLCache(maxsize=2048, disk_path=disk_path)
+
+
+def normalize_query(query):
+    return " ".join(query.strip().strip("\"'").lower().split())
+
+
+def cached_tool_run(cache, tool_name, func, query):
+    key = f"{tool_name}:{normalize_query(query)}"
+    return cache.get_or_set(key, lambda: func(query), ttl=TOOL_CACHE_TTLS.get(tool_name))
+
+
+TOOL_DESCRIPTIONS = {
+    "Wikipedia": "A useful tool for searching the Internet to find information on world events, issues, dates, years, etc.",
+    "ArXiv": "A useful tool for searching scientific and research papers.",
+    "DuckDuckGo Search": "Useful for when you need to search the internet to find latest information, facts and figures that another tool can't find.",
+}
+
+
+def tool_runner(tool_name):
+    # Each API wrapper (and the package behind it) is imported when its tool is first used
+    if tool_name == "Wikipedia":
+        return lazy_import("langchain_community.utilities").WikipediaAPIWrapper(top_k_results=2, doc_content_chars_max=500).run
+    if tool_name == "ArXiv":
+        return lazy_import("langchain_community.utilities").ArxivAPIWrapper(top_k_results=2, doc_content_chars_max=500).run
+    return lazy_import("langchain_community.tools").DuckDuckGoSearchRun().run
+
+
+@st.cache_resource
+def get_tool(tool_name):
+    # API wrappers are built once per process and every call goes through the shared result cache
+    return Tool(
+        name=tool_name,
+        func=partial(cached_tool_run, get_tool_cache(), tool_name, tool_runner(tool_name)),
+        description=TOOL_DESCRIPTIONS[tool_name],
+    )
 
 
 def get_tools(selected_tools):
-    # Define all available tools
-    tools = {
-        "Wikipedia": Tool(
-            name="Wikipedia",
-            func=WikipediaAPIWrapper(top_k_results=2, doc_content_chars_max=500).run,
-            description="A useful tool for searching the Internet to find information on world events, issues, dates, years, etc."
-        ),
-        "ArXiv": Tool(
-            name="ArXiv",
-            func=ArxivAPIWrapper(top_k_results=2, doc_content_chars_max=500).run,
-            description="A useful tool for searching scientific and research papers."
-        ),
-        "DuckDuckGo Search": Tool(
-            name="DuckDuckGo Search",
-            func=DuckDuckGoSearchRun().run,
-            description="Useful for when you need to search the internet to find latest information, facts and figures that another tool can't find."
-        )
-    }
-
-    # Filter and return only the tools selected by the user
-    return [tools[tool_name] for tool_name in selected_tools]
-
-
-def summarizer_model(model_params, api_key, url):
-    llm = ChatGroq(model=model_params['model'], api_key=api_key,
+    return [get_tool(tool_name) for tool_name in selected_tools]
+
+
+def summarizer_model(model_params, api_key, url, on_progress=None):
+    llm = get_groq_llm(api_key=api_key, model=model_params['model'],
             temperature=model_params["temperature"],
             max_tokens=model_params['max_tokens']
             )
-    try:
-        if "youtube.com" in url or "youtu.be" in url:
-            video_id = YoutubeLoader.extract_video_id(url)
-
-            loader = YoutubeLoader.from_youtube_url("https://www.youtube.com/watch?v=" + video_id,
-                                                    add_video_info=False,
-                                                    language=["en", "hi"],
-                                                    translation="en",
-                                                    continue_on_failure=True) 
-        else:
-            loader = WebBaseLoader(web_path=url)
-
-        data = loader.load()
-
-        prompt_template = """Provide a summary of the following content in proper markdown:
-        Content:\n{text}"""
-
-        prompt = PromptTemplate(input_variables=["text"], template=prompt_template)
-
-        chain = load_summarize_chain(llm=llm, chain_type="stuff", prompt=prompt)
-        output = chain.run(data)
-        return output
-    except Exception:
-        st.error(f"An error occurred:An error occurred: Could not retrieve a transcript for the video", icon="❌")
+    # Loaders and splitters are only imported once the Summarizer is used
+    summarization = lazy_import("summarization")
+
+    # Fetched pages/transcripts and finished summaries are both cached across sessions; errors are shown by the caller
+    text = summarization.load_url_text(url)
+    if not text.strip():
+        raise ValueError("Could not retrieve a transcript or any text from this URL.")
+
+    summary_cache = summarization.get_summary_cache()
+    key = summarization.summary_cache_key(text, model_params['model'], model_params['temperature'], model_params['max_tokens'])
+
+    # Short content is stuffed into one prompt, long content is map-reduced in parallel
+    output = summary_cache.get_or_set(key, lambda: summarization.summarize_text(llm, text, model=model_params['model'],
+                                                                  max_tokens=model_params['max_tokens'],
+                                                                  on_progress=on_progress))
+    if not output:
+        raise ValueError("The summarizer returned an empty summary.")
+    return output
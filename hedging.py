@@ -0,0 +1,120 @@
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from tracing import current_span, in_current_context
+from rate_limiter import report_waits, WAIT_POLL_SECONDS
+import queue
+import threading
+import time
+
+HEDGE_DELAY_MS = 600
+HEDGE_WORKERS = 16
+
+
+@st.cache_resource
+def get_hedge_executor():
+    # A losing request keeps its worker until its first token arrives, so the pool is larger than the number of sessions answering at once
+    return ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="groq-hedge")
+
+
+def get_hedge_metrics():
+    if "hedge_metrics" not in st.session_state:
+        st.session_state.hedge_metrics = {"turns": 0, "hedged": 0, "backup_wins": 0, "wins_by_model": {}}
+    return st.session_state.hedge_metrics
+
+
+def _produce(index, stream_factory, events, cancelled):
+    stream = None
+    try:
+        stream = stream_factory()
+        for chunk in stream:
+            events.put((index, "chunk", chunk, time.perf_counter()))
+            if cancelled.is_set():
+                return
+        events.put((index, "done", None, time.perf_counter()))
+    except Exception as e:
+        events.put((index, "error", e, time.perf_counter()))
+    finally:
+        # Closing the generator closes the HTTP stream, the provider stops generating
+        if hasattr(stream, "close"):
+            stream.close()
+
+
+def hedged_stream(primary, backup, delay_ms=HEDGE_DELAY_MS, models=(None, None)):
+    """Streams `primary`; starts `backup` if no token arrived within `delay_ms` and keeps whichever answers first.
+
+    The loser is cancelled after its first token (or right away once the winner is done), so the time to first
+    token gained over the primary is measured rather than guessed. `models` names the primary and backup in the trace.
+    """
+    active, metrics = current_span(), get_hedge_metrics()
+    events = queue.Queue()
+    factories, cancelled = [primary, backup], [threading.Event(), threading.Event()]
+    first_token, failed = {}, {}
+    start = time.perf_counter()
+
+    def launch(index):
+        get_hedge_executor().submit(in_current_context(_produce), index, factories[index], events, cancelled[index])
+
+    launch(0)
+    launched, winner = 1, None
+    try:
+        while True:
+            hedge_pending = launched == 1 and winner is None
+            hedge_in = start + delay_ms / 1000 - time.perf_counter()
+            try:
+                index, kind, value, at = events.get(timeout=min(max(hedge_in, 0), WAIT_POLL_SECONDS)
+                                                    if hedge_pending else WAIT_POLL_SECONDS)
+            except queue.Empty:
+                # Both requests run on pool threads, their queue positions are shown from here
+                report_waits()
+                if hedge_pending and hedge_in <= WAIT_POLL_SECONDS:
+                    launch(1)
+                    launched = 2
+                continue
+
+            if kind == "chunk":
+                first_token.setdefault(index, at)
+                if winner is None:
+                    winner = index
+                    # The loser stops at its next token, which is when its time to first token is known
+                    cancelled[1 - index].set()
+                if index == winner:
+                    yield value
+            elif kind == "error":
+                failed[index] = value
+                if winner == index:
+                    raise value
+                if winner is None and launched == 1:
+                    # The primary failed before answering: fail over without waiting out the delay
+                    launch(1)
+                    launched = 2
+                elif winner is None and len(failed) == launched:
+                    raise failed[0]
+            elif kind == "done":
+                if winner is None:
+                    winner = index
+                if index == winner:
+                    return
+    finally:
+        for event in cancelled:
+            event.set()
+        _record(active, metrics, winner, launched, first_token, failed, models)
+
+
+def _record(active, metrics, winner, launched, first_token, failed, models):
+    metrics["turns"] += 1
+    metrics["hedged"] += launched == 2
+    metrics["backup_wins"] += winner == 1
+    if winner is not None and models[winner]:
+        metrics["wins_by_model"][models[winner]] = metrics["wins_by_model"].get(models[winner], 0) + 1
+    if active is None or winner is None:
+        return
+    attributes = {"hedged": launched == 2, "winner": "backup" if winner == 1 else "primary"}
+    if models[winner]:
+        attributes["winner_model"] = models[winner]
+    if winner == 1 and 0 not in failed and 1 in first_token:
+        # Without a primary token yet, the gain is at least the time the primary has been silent since the backup won
+        primary_first = first_token.get(0, time.perf_counter())
+        attributes.update(ttft_gain_ms=round((primary_first - first_token[1]) * 1000, 1), ttft_gain_lower_bound=0 not in first_token)
+    elif winner == 0:
+        attributes["ttft_gain_ms"] = 0.0
+    active.set(**attributes)
@@ -0,0 +1,17 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from rate_limiter import acquire, DEFAULT_COMPLETION_TOKENS
+
+
+###--- Every LLM call (chatbot, each agent step, summarizer) waits for a slot of its key ---###
+class RateLimitCallbackHandler(BaseCallbackHandler):
+    # A full queue must fail the call, not be logged and ignored
+    raise_error = True
+
+    def __init__(self, scheduler, max_tokens=None):
+        self.scheduler = scheduler
+        self.max_tokens = max_tokens
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        # Runs on the thread making the call, before the SDK sends anything
+        prompt_chars = sum(len(str(message.content)) for batch in messages for message in batch)
+        acquire(self.scheduler, prompt_chars // 4 + (self.max_tokens or DEFAULT_COMPLETION_TOKENS))
@@ -0,0 +1,50 @@
+from langchain_core.callbacks import BaseCallbackHandler
+from tracing import get_tracer, current_span
+
+
+###--- LangChain callbacks: LLM calls and tool calls as spans ---###
+class TracingCallbackHandler(BaseCallbackHandler):
+    def __init__(self, parent=None):
+        self.parent = parent or current_span()
+        self.tracer = get_tracer()
+        self._spans = {}
+
+    def _start(self, run_id, parent_run_id, name, **attributes):
+        parent = self._spans.get(parent_run_id, self.parent)
+        self._spans[run_id] = self.tracer.start(name, parent, **attributes)
+
+    def _end(self, run_id, error=None, **attributes):
+        active = self._spans.pop(run_id, None)
+        if active is not None:
+            active.set(**attributes)
+            self.tracer.end(active, error=error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        model = (kwargs.get("metadata") or {}).get("ls_model_name", "")
+        self._start(run_id, parent_run_id, "llm", model=model,
+                    prompt_chars=sum(len(str(message.content)) for batch in messages for message in batch))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        active = self._spans.get(run_id)
+        if active is not None and "ttft_ms" not in active.attributes:
+            active.set(ttft_ms=round(active.elapsed_ms(), 1))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            usage = {"prompt_tokens": metadata.get("input_tokens"), "completion_tokens": metadata.get("output_tokens")}
+        self._end(run_id, prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, f"tool.{serialized.get('name', 'unknown')}", input_chars=len(input_str))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
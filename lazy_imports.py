@@ -0,0 +1,47 @@
+import importlib
+import os
+import sys
+import threading
+import time
+
+# First-import cost per module, shown in the sidebar debug panel
+IMPORT_REPORT = {}
+_lock = threading.Lock()
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return 0.0
+    # Peak instead of current RSS where /proc is not available (kilobytes on Linux, bytes on macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def lazy_import(name):
+    """Imports a heavy dependency on first use and records how long it took and how much memory it added."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    # Serialized so concurrent sessions don't both pay for (and both report) the same first import
+    with _lock:
+        if name in sys.modules:
+            return sys.modules[name]
+        rss_before, start = current_rss_mb(), time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_REPORT[name] = {
+            "module": name,
+            "seconds": round(time.perf_counter() - start, 3),
+            "rss_mb": round(current_rss_mb() - rss_before, 1),
+        }
+    return module
+
+
+def import_report():
+    return sorted(IMPORT_REPORT.values(), key=lambda row: row["seconds"], reverse=True)
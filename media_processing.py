@@ -0,0 +1,188 @@
+import streamlit as st
+from PIL import Image, ImageOps
+from io import BytesIO
+from blob_store import get_blob_store
+from lazy_imports import lazy_import
+import wave
+
+# Gemini tiles images internally, anything above ~1.5k px per edge only costs bandwidth
+IMAGE_MAX_EDGE = 1536
+IMAGE_QUALITY = 80
+IMAGE_FORMAT = "WEBP"
+IMAGE_FORMATS = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+
+
+###--- Image downscaling and recompression ---###
+def preprocess_image(data, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_QUALITY, image_format=IMAGE_FORMAT):
+    image = Image.open(BytesIO(data))
+    image = ImageOps.exif_transpose(image)  # apply the camera rotation before EXIF is dropped
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha and image_format != "JPEG" else "RGB")
+
+    output = BytesIO()
+    # Saving without exif/icc arguments strips the metadata
+    image.save(output, format=image_format, quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def store_preprocessed_image(data, mime_type, max_edge, quality, image_format):
+    processed = preprocess_image(data, max_edge, quality, image_format)
+
+    # Keep the original when it is already smaller, e.g. a tiny optimized JPEG
+    if len(processed) >= len(data):
+        processed, mime_type = data, mime_type
+    else:
+        mime_type = IMAGE_FORMATS[image_format]
+
+    return {
+        "blob": get_blob_store().put(processed),
+        "mime_type": mime_type,
+        "original_size": len(data),
+        "size": len(processed),
+    }
+
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def preprocess_image_blob(original_hash, _data, mime_type, max_edge, quality, image_format):
+    # Keyed by the content hash of the original; the bytes themselves are not hashed again
+    return store_preprocessed_image(_data, mime_type, max_edge, quality, image_format)
+
+
+def add_preprocessed_image(data, mime_type, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_QUALITY, image_format=IMAGE_FORMAT):
+    original_hash = get_blob_store().hash(data)
+    result = preprocess_image_blob(original_hash, data, mime_type, max_edge, quality, image_format)
+
+    if result["blob"] not in get_blob_store():  # evicted from the store since it was cached
+        result = store_preprocessed_image(data, mime_type, max_edge, quality, image_format)
+    return result
+
+
+###--- Speech trimming, downmixing and resampling ---###
+# Gemini downsamples audio to 16 kHz mono itself, anything above that is only upload bytes
+AUDIO_SAMPLE_RATE = 16000
+VAD_FRAME_MS = 30
+VAD_PADDING_MS = 250
+VAD_MIN_DBFS = -50
+VAD_NOISE_MARGIN_DB = 12
+WAV_MIME_TYPES = ("audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave")
+
+
+def decode_wav(data):
+    """Returns (samples, rate) with float32 samples in [-1, 1] shaped (frames, channels)."""
+    np = lazy_import("numpy")
+    with wave.open(BytesIO(data)) as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 3:
+        # 24-bit: place the three bytes in the top of an int32
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view("<i4").ravel().astype(np.float32) / 2 ** 31
+    else:
+        dtype = {2: "<i2", 4: "<i4"}[width]
+        samples = np.frombuffer(frames, dtype=dtype).astype(np.float32) / 2 ** (8 * width - 1)
+    return samples.reshape(-1, channels), rate
+
+
+def trim_silence(samples, rate, frame_ms=VAD_FRAME_MS, padding_ms=VAD_PADDING_MS):
+    """Drops leading and trailing frames whose energy stays near the noise floor; pauses inside speech are kept."""
+    np = lazy_import("numpy")
+    frame = max(1, rate * frame_ms // 1000)
+    frames = len(samples) // frame
+    if frames == 0:
+        return samples
+
+    rms = np.sqrt(np.mean(samples[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+    dbfs = 20 * np.log10(np.maximum(rms, 1e-10))
+    threshold = max(VAD_MIN_DBFS, np.percentile(dbfs, 10) + VAD_NOISE_MARGIN_DB)
+    voiced = np.flatnonzero(dbfs > threshold)
+    if len(voiced) == 0:
+        return samples  # nothing but silence; better to send it than an empty file
+
+    padding = padding_ms * rate // 1000
+    start = max(0, voiced[0] * frame - padding)
+    end = min(len(samples), (voiced[-1] + 1) * frame + padding)
+    return samples[start:end]
+
+
+def resample(samples, rate, target_rate=AUDIO_SAMPLE_RATE, taps=63):
+    np = lazy_import("numpy")
+    if rate == target_rate:
+        return samples
+    if rate > target_rate:
+        # Windowed-sinc low-pass below the new Nyquist frequency, so downsampling doesn't alias
+        cutoff = 0.45 * target_rate / rate
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+        samples = np.convolve(samples, (kernel / kernel.sum()).astype(np.float32), mode="same")
+    positions = np.arange(int(len(samples) * target_rate / rate)) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def encode_wav(samples, rate):
+    np = lazy_import("numpy")
+    output = BytesIO()
+    with wave.open(output, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return output.getvalue()
+
+
+def preprocess_audio(data, target_rate=AUDIO_SAMPLE_RATE):
+    samples, rate = decode_wav(data)
+    mono = samples.mean(axis=1)
+    target_rate = min(rate, target_rate)  # never upsampled
+    return encode_wav(resample(trim_silence(mono, rate), rate, target_rate), target_rate)
+
+
+def store_preprocessed_audio(data, mime_type):
+    try:
+        processed, processed_type = preprocess_audio(data), "audio/wav"
+    except (wave.Error, EOFError, KeyError, ValueError):
+        processed = None  # compressed or non-PCM WAV; uploaded as it is
+
+    if processed is None or len(processed) >= len(data):
+        processed, processed_type = data, mime_type
+
+    return {
+        "blob": get_blob_store().put(processed),
+        "mime_type": processed_type,
+        "original_size": len(data),
+        "size": len(processed),
+    }
+
+
+@st.cache_data(max_entries=1000, show_spinner=False)
+def preprocess_audio_blob(original_hash, _data, mime_type):
+    return store_preprocessed_audio(_data, mime_type)
+
+
+def add_preprocessed_audio(data, mime_type):
+    if mime_type not in WAV_MIME_TYPES:
+        return {"blob": get_blob_store().put(data), "mime_type": mime_type, "original_size": len(data), "size": len(data)}
+
+    result = preprocess_audio_blob(get_blob_store().hash(data), data, mime_type)
+    if result["blob"] not in get_blob_store():
+        result = store_preprocessed_audio(data, mime_type)
+    return result
+
+
+###--- Small previews for collapsed chat history ---###
+THUMBNAIL_SIZE = 96
+
+@st.cache_data(max_entries=2000, show_spinner=False)
+def image_thumbnail(blob_hash, size=THUMBNAIL_SIZE):
+    with get_blob_store().open(blob_hash) as f:
+        image = Image.open(f)
+        image.thumbnail((size, size))
+        output = BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=70)
+    return output.getvalue()
@@ -0,0 +1,242 @@
+import streamlit as st
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+from utils import key_fingerprint
+
+# (requests per minute, tokens per minute) per key and model; free-tier defaults, override with RATE_LIMITS_JSON
+PROVIDER_RATE_LIMITS = {"groq": (30, 6000), "google": (15, 1_000_000)}
+MODEL_RATE_LIMITS = {
+    "gemini-1.5-pro": (2, 32_000),
+    "llama-3.1-70b-versatile": (30, 6000),
+    "llama3-70b-8192": (30, 6000),
+    "mixtral-8x7b-32768": (30, 5000),
+    "gemma2-9b-it": (30, 15_000),
+    **json.loads(os.environ.get("RATE_LIMITS_JSON", "{}")),
+}
+QUEUE_TIMEOUT_SECONDS = 120
+RETRY_ATTEMPTS = 4
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS = 30.0
+DEFAULT_COMPLETION_TOKENS = 512
+# How often a script thread waiting on workers shows the queue positions they reported
+WAIT_POLL_SECONDS = 0.5
+
+
+class ProviderBusyError(Exception):
+    pass
+
+
+###--- Continuously refilling budget of requests or tokens ---###
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        self._refill(now)
+        # A request larger than the whole budget is let through once the bucket is full
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+###--- Requests for one key and model, served round-robin across sessions ---###
+class KeyScheduler:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+        self._queues = OrderedDict()  # session -> deque of waiting tickets, in serving order
+        self._cond = threading.Condition()
+
+    def _order(self):
+        # One ticket per session per round, so a session firing many calls can't starve the others
+        queues = [list(queue) for queue in self._queues.values()]
+        return [queue[i] for i in range(max(map(len, queues), default=0)) for queue in queues if i < len(queue)]
+
+    def acquire(self, session, tokens, on_wait=None, timeout=QUEUE_TIMEOUT_SECONDS):
+        ticket = object()
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._queues.setdefault(session, deque()).append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    order = self._order()
+                    if order[0] is ticket:
+                        wait = max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                        if wait <= 0:
+                            self.requests.take(1, now)
+                            self.tokens.take(tokens, now)
+                            return
+                    else:
+                        wait = None
+                    position = order.index(ticket) + 1
+
+                if time.monotonic() >= deadline:
+                    raise ProviderBusyError(f"No free slot for this API key after {timeout} s ({position - 1} request(s) ahead), "
+                                       "please try again shortly.")
+                if on_wait:
+                    on_wait(position, wait)
+                with self._cond:
+                    self._cond.wait(min(wait or 1.0, 1.0, max(deadline - time.monotonic(), 0.01)))
+        finally:
+            with self._cond:
+                queue = self._queues.get(session)
+                if queue is not None:
+                    queue.remove(ticket)
+                    if queue:
+                        self._queues.move_to_end(session)
+                    else:
+                        del self._queues[session]
+                self._cond.notify_all()
+
+    def wait_if_paused(self, max_seconds=RETRY_MAX_SECONDS):
+        with self._cond:
+            deadline = min(self.paused_until, time.monotonic() + max_seconds)
+            while time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+
+    def pause(self, seconds):
+        # A 429 for one session means the key is exhausted for everyone
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+
+class RateLimiter:
+    def __init__(self):
+        self._schedulers = {}
+        self._lock = threading.Lock()
+
+    def scheduler(self, provider, api_key, model):
+        key = (provider, key_fingerprint(api_key), model)
+        with self._lock:
+            if key not in self._schedulers:
+                self._schedulers[key] = KeyScheduler(*MODEL_RATE_LIMITS.get(model, PROVIDER_RATE_LIMITS[provider]))
+            return self._schedulers[key]
+
+
+@st.cache_resource
+def get_rate_limiter():
+    return RateLimiter()
+
+
+###--- Who is waiting: set by the app around a turn, read wherever the call is made ---###
+_waiter = contextvars.ContextVar("rate_limit_waiter", default=("anonymous", None, None, None))
+
+
+@contextmanager
+def waiting_as(session, on_wait=None):
+    # on_wait updates the UI, so it is only called from the thread that set it; worker threads queue their updates
+    token = _waiter.set((session, on_wait, threading.get_ident(), queue.SimpleQueue()))
+    try:
+        yield
+    finally:
+        _waiter.reset(token)
+
+
+def acquire(scheduler, tokens):
+    session, on_wait, thread_id, updates = _waiter.get()
+    if on_wait and thread_id != threading.get_ident():
+        on_wait = lambda position, seconds: updates.put((position, seconds))
+    scheduler.acquire(session, tokens, on_wait)
+
+
+def report_waits():
+    """Shows the latest queue position reported by worker threads; called by the script thread while it waits on them."""
+    _, on_wait, thread_id, updates = _waiter.get()
+    if not on_wait or thread_id != threading.get_ident():
+        return
+    latest = None
+    while not updates.empty():
+        latest = updates.get()
+    if latest:
+        on_wait(*latest)
+
+
+###--- Retries on 429 and 5xx ---###
+def error_status(error):
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error):
+    status = error_status(error)
+    return status is not None and (status == 429 or 500 <= status < 600)
+
+
+def retry_delay(attempt, error=None):
+    response = getattr(error, "response", None)
+    retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        # Full jitter keeps sessions that failed together from retrying together
+        return random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+
+
+def retrying_stream(stream_factory, scheduler, attempts=RETRY_ATTEMPTS):
+    """Retries a stream that fails before its first chunk; the factory acquires a slot for every attempt."""
+    for attempt in range(attempts):
+        started = False
+        try:
+            for chunk in stream_factory():
+                started = True
+                yield chunk
+            return
+        except Exception as e:
+            if started or not is_retryable(e) or attempt == attempts - 1:
+                raise
+            scheduler.pause(retry_delay(attempt, e))
+
+
+def retrying_call(func, scheduler, attempts=RETRY_ATTEMPTS):
+    for attempt in range(attempts):
+        try:
+            return func()
+        except Exception as e:
+            if not is_retryable(e) or attempt == attempts - 1:
+                raise
+            scheduler.pause(retry_delay(attempt, e))
+
+
+def describe_error(error):
+    # SDKs wrap the underlying error, e.g. Groq's APIConnectionError around a ProviderBusyError
+    while error.__cause__ is not None and not isinstance(error, ProviderBusyError) and error_status(error) is None:
+        error = error.__cause__
+    if error_status(error) == 429:
+        return "The provider is rate limiting this API key right now. Please try again in a minute."
+    return str(error)
+
+
+###--- HTTP hooks for SDKs built on httpx (Groq) ---###
+def http_event_hooks(scheduler):
+    # The slot is taken before the call (RateLimitCallbackHandler); hooks only share 429/5xx pauses across sessions.
+    # They never raise: the SDK would treat any error as a connection failure and retry it.
+    def on_request(request):
+        scheduler.wait_if_paused()
+
+    def on_response(response):
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = response.headers.get("retry-after")
+            scheduler.pause(float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit()
+                            else random.uniform(0, RETRY_BASE_SECONDS))
+
+    return {"request": [on_request], "response": [on_response]}
@@ -0,0 +1,60 @@
+import streamlit as st
+from cache import TTLCache
+import hashlib
+import json
+import re
+
+RESPONSE_CACHE_TTL_SECONDS = 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+REPLAY_CHUNK = re.compile(r"\S+\s*|\s+")
+
+
+@st.cache_resource
+def get_response_cache():
+    return TTLCache(maxsize=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL_SECONDS)
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def is_cacheable(temperature):
+    # Sampling at temperature > 0 is meant to vary, replaying an old answer would change behaviour
+    return st.session_state.get("cache_responses", False) and temperature == 0
+
+
+def response_cache_key(model, temperature, max_tokens, system_prompt, history, question):
+    payload = json.dumps([model, temperature, max_tokens, normalize_text(system_prompt), history, normalize_text(question)],
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_session_metrics():
+    if "response_cache_metrics" not in st.session_state:
+        st.session_state.response_cache_metrics = {"hits": 0, "misses": 0}
+    return st.session_state.response_cache_metrics
+
+
+###--- Replaying cached answers through the same streaming interface ---###
+def replay(text):
+    yield from REPLAY_CHUNK.findall(text)
+
+
+def cached_stream(key, stream_factory):
+    cache = get_response_cache()
+    metrics = get_session_metrics()
+
+    cached = cache.get(key)
+    if cached is not None:
+        metrics["hits"] += 1
+        yield from replay(cached)
+        return
+
+    metrics["misses"] += 1
+    chunks = []
+    for chunk in stream_factory():
+        chunks.append(chunk)
+        yield chunk
+
+    # Only complete answers are stored; an interrupted stream never reaches this point
+    cache.set(key, "".join(chunks))
@@ -0,0 +1,205 @@
+import streamlit as st
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import YoutubeLoader
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from bs4 import BeautifulSoup
+from cache import TTLCache
+from utils import get_cache_dir
+from tracing import in_current_context
+from rate_limiter import report_waits, WAIT_POLL_SECONDS
+import hashlib
+import os
+import requests
+import time
+
+MODEL_CONTEXT_WINDOWS = {
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.1-70b-versatile": 131072,
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "gemma2-9b-it": 8192,
+    "mixtral-8x7b-32768": 32768,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# One huge prompt is the slowest path even when it fits, so chunks are capped well below 128k
+MAX_CHUNK_TOKENS = 6000
+PROMPT_OVERHEAD_TOKENS = 300
+CHUNK_OVERLAP_TOKENS = 50
+SUMMARY_CONCURRENCY = 4
+CHARS_PER_TOKEN = 4
+
+# Transcripts never change; web pages are revalidated with ETag/Last-Modified once they are a few minutes old
+TRANSCRIPT_TTL_SECONDS = 7 * 24 * 60 * 60
+WEB_PAGE_TTL_SECONDS = 24 * 60 * 60
+REVALIDATE_AFTER_SECONDS = 10 * 60
+SUMMARY_TTL_SECONDS = 7 * 24 * 60 * 60
+
+MAP_PROMPT = PromptTemplate.from_template("""Summarize the following part of a longer content.
+Keep every key point, name, number and conclusion, and leave out filler.
+Part:\n{text}""")
+
+REDUCE_PROMPT = PromptTemplate.from_template("""The following are summaries of consecutive parts of the same content.
+Merge them into one coherent summary that keeps every key point, without repeating yourself.
+Summaries:\n{text}""")
+
+FINAL_PROMPT = PromptTemplate.from_template("""Provide a summary of the following content in proper markdown:
+        Content:\n{text}""")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_token_budget(model, max_tokens):
+    context_window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return max(500, min(context_window - max_tokens - PROMPT_OVERHEAD_TOKENS, MAX_CHUNK_TOKENS))
+
+
+def split_text(text, chunk_tokens):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens * CHARS_PER_TOKEN,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS * CHARS_PER_TOKEN,
+    )
+    return splitter.split_text(text)
+
+
+def group_to_budget(texts, chunk_tokens):
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > chunk_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return ["\n\n".join(group) for group in groups]
+
+
+###--- Bounded-parallel map step, progress is reported from the calling thread ---###
+def summarize_parts(llm, prompt, parts, stage, on_progress=None):
+    chain = prompt | llm | StrOutputParser()
+    summaries = [None] * len(parts)
+
+    with ThreadPoolExecutor(max_workers=min(SUMMARY_CONCURRENCY, len(parts))) as pool:
+        # Workers keep the caller's context, so their calls queue under the caller's session
+        futures = {pool.submit(in_current_context(chain.invoke), {"text": part}): index for index, part in enumerate(parts)}
+        pending, done = set(futures), 0
+        while pending:
+            finished, pending = wait(pending, timeout=WAIT_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            report_waits()
+            for future in finished:
+                summaries[futures[future]] = future.result()
+                done += 1
+                if on_progress:
+                    on_progress(stage, done, len(parts))
+    return summaries
+
+
+def summarize_text(llm, text, model, max_tokens, on_progress=None):
+    """Stuffs the text into one prompt when it fits, otherwise map-reduces it hierarchically."""
+    chunk_tokens = chunk_token_budget(model, max_tokens)
+    final_chain = FINAL_PROMPT | llm | StrOutputParser()
+
+    if estimate_tokens(text) <= chunk_tokens:
+        return final_chain.invoke({"text": text})
+
+    summaries = summarize_parts(llm, MAP_PROMPT, split_text(text, chunk_tokens), "Summarizing parts", on_progress)
+
+    level = 1
+    while estimate_tokens("\n\n".join(summaries)) > chunk_tokens:
+        groups = group_to_budget(summaries, chunk_tokens)
+        if len(groups) == len(summaries):
+            # Every summary fills a whole budget on its own, split them further
+            groups = split_text("\n\n".join(summaries), chunk_tokens)
+        summaries = summarize_parts(llm, REDUCE_PROMPT, groups, f"Combining summaries (level {level})", on_progress)
+        level += 1
+
+    return final_chain.invoke({"text": "\n\n".join(summaries)})
+
+
+###--- Caches for fetched content and finished summaries, shared by all sessions ---###
+@st.cache_resource
+def get_document_cache():
+    return TTLCache(maxsize=256, ttl=WEB_PAGE_TTL_SECONDS,
+                    disk_path=os.path.join(get_cache_dir(), "summarizer_documents.sqlite3"),
+                    disk_max_bytes=512 * 1024 * 1024)
+
+
+@st.cache_resource
+def get_summary_cache():
+    return TTLCache(maxsize=1024, ttl=SUMMARY_TTL_SECONDS,
+                    disk_path=os.path.join(get_cache_dir(), "summaries.sqlite3"),
+                    disk_max_bytes=64 * 1024 * 1024)
+
+
+def is_youtube_url(url):
+    return "youtube.com" in url or "youtu.be" in url
+
+
+def normalize_url(url):
+    if is_youtube_url(url):
+        return "youtube:" + YoutubeLoader.extract_video_id(url)
+
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", query, ""))
+
+
+def load_youtube_text(url):
+    video_id = YoutubeLoader.extract_video_id(url)
+
+    loader = YoutubeLoader.from_youtube_url("https://www.youtube.com/watch?v=" + video_id,
+                                            add_video_info=False,
+                                            language=["en", "hi"],
+                                            translation="en",
+                                            continue_on_failure=True)
+    return "\n\n".join(doc.page_content for doc in loader.load())
+
+
+def fetch_web_page(url, cached=None):
+    headers = {"User-Agent": os.environ.get("USER_AGENT", "Mozilla/5.0 (compatible; SuperAIAssistant)")}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = requests.get(url, headers=headers, timeout=30)
+    if response.status_code == 304 and cached:
+        return {**cached, "checked_at": time.time()}
+
+    response.raise_for_status()
+    return {
+        # Same text extraction as WebBaseLoader
+        "text": BeautifulSoup(response.text, "html.parser").get_text(),
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "checked_at": time.time(),
+    }
+
+
+def load_url_text(url, cache=None):
+    cache = cache or get_document_cache()
+    key = normalize_url(url)
+    cached = cache.get(key)
+
+    if is_youtube_url(url):
+        if cached is None:
+            cached = {"text": load_youtube_text(url)}
+            if cached["text"].strip():  # a missing transcript may show up later
+                cache.set(key, cached, ttl=TRANSCRIPT_TTL_SECONDS)
+        return cached["text"]
+
+    if cached is None or time.time() - cached["checked_at"] > REVALIDATE_AFTER_SECONDS:
+        cached = fetch_web_page(url, cached)
+        cache.set(key, cached, ttl=WEB_PAGE_TTL_SECONDS)
+    return cached["text"]
+
+
+def summary_cache_key(text, model, temperature, max_tokens):
+    return f"{hashlib.sha256(text.encode()).hexdigest()}:{model}:{temperature}:{max_tokens}"
@@ -0,0 +1,169 @@
+import streamlit as st
+from collections import deque
+from contextlib import contextmanager
+from utils import get_cache_dir
+import contextvars
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+
+TRACE_FILE = os.environ.get("TRACE_FILE") or os.path.join(get_cache_dir("traces"), "spans.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.environ.get("TRACE_FILE_MAX_MB", 20)) * 1024 * 1024
+RECENT_TRACES = 100
+# Span attributes reported alongside durations in the debug panel
+TIMING_ATTRIBUTES = {"ttft_ms": "first token", "ttft_gain_ms": "first token gained"}
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+###--- One timed operation, exported with OTLP/JSON field names ---###
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": int(self.start_time * 1e9),
+            "endTimeUnixNano": int((self.start_time + self.duration) * 1e9),
+            "attributes": self.attributes,
+            "status": self.status,
+        }
+
+
+###--- Collects finished spans, appends them to a JSONL file and keeps recent traces for the debug panel ---###
+class Tracer:
+    def __init__(self, path=TRACE_FILE, max_bytes=TRACE_FILE_MAX_BYTES, recent=RECENT_TRACES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.traces = deque(maxlen=recent)  # [root span, *children] per finished trace
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def start(self, name, parent=None, **attributes):
+        span = Span(name, parent, attributes)
+        with self._lock:
+            self._open.setdefault(span.trace_id, []).append(span)
+        return span
+
+    def end(self, span, error=None):
+        span.duration = time.perf_counter() - span._start
+        if error is not None:
+            span.status = "error"
+            span.set(error=repr(error))
+
+        with self._lock:
+            if span.parent_id is None:
+                self.traces.append(self._open.pop(span.trace_id, [span]))
+            self._export(span)
+
+    def _export(self, span):
+        if not self.path:
+            return
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a") as f:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+        except OSError:
+            pass  # tracing must never break a turn
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        """Duration (and time to first token) percentiles in ms per span name over the recent traces."""
+        with self._lock:
+            spans = [span for trace in self.traces for span in trace if span.duration is not None]
+
+        samples = {}
+        for span in spans:
+            samples.setdefault(span.name, []).append(span.duration * 1000)
+            for attribute, label in TIMING_ATTRIBUTES.items():
+                if attribute in span.attributes:
+                    samples.setdefault(f"{span.name} ({label})", []).append(span.attributes[attribute])
+
+        rows = []
+        for name, values in sorted(samples.items()):
+            cuts = statistics.quantiles(values, n=100, method="inclusive") if len(values) > 1 else values * 99
+            rows.append({"span": name, "count": len(values),
+                         **{f"p{q} (ms)": round(cuts[q - 1]) for q in quantiles}})
+        return rows
+
+
+@st.cache_resource
+def get_tracer():
+    return Tracer()
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    tracer = get_tracer()
+    active = tracer.start(name, current_span(), **attributes)
+    token = _current_span.set(active)
+    try:
+        yield active
+    except BaseException as e:
+        tracer.end(active, error=e)
+        raise
+    else:
+        tracer.end(active)
+    finally:
+        _current_span.reset(token)
+
+
+def in_current_context(func):
+    # Worker threads start with an empty context; this keeps their spans attached to the caller's
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def traced_stream(name, stream, **attributes):
+    """Yields the stream unchanged, recording time to first chunk, chunk count and characters."""
+    tracer = get_tracer()
+    active = tracer.start(name, current_span(), **attributes)
+    iterator = iter(stream)
+    chunks = chars = 0
+    try:
+        while True:
+            # The span is only current while the wrapped generator runs, never while the caller does
+            token = _current_span.set(active)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                _current_span.reset(token)
+
+            if not chunks:
+                active.set(ttft_ms=round(active.elapsed_ms(), 1))
+            chunks += 1
+            chars += len(chunk)
+            yield chunk
+    except BaseException as e:
+        active.set(chunks=chunks, chars=chars)
+        tracer.end(active, error=None if isinstance(e, GeneratorExit) else e)
+        raise
+    active.set(chunks=chunks, chars=chars)
+    tracer.end(active)
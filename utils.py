@@ -1,4 +1,7 @@
 import streamlit as st
+import hashlib
+import os
+import tempfile
 
 def about():
     about_text = """This AI-powered Streamlit app allows users to interact with various LLMs through
@@ -30,3 +33,27 @@ def set_safety_settings():
 ]
 
     return safety_settings
+
+
+def get_cache_dir(*parts):
+    # All on-disk state lives under one root so it can be moved to a volume with SUPER_AI_CACHE_DIR
+    root = os.environ.get("SUPER_AI_CACHE_DIR") or _private_temp_dir("super_ai_assistant")
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _private_temp_dir(name):
+    # The default root holds every user's chats and media in a shared temp directory: it must belong to us and stay private
+    path = os.path.join(tempfile.gettempdir(), name)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if hasattr(os, "getuid"):
+        if os.lstat(path).st_uid != os.getuid() or os.path.islink(path):
+            raise PermissionError(f"{path} belongs to another user; set SUPER_AI_CACHE_DIR to a private directory")
+        os.chmod(path, 0o700)
+    return path
+
+
+def key_fingerprint(api_key):
+    # Per-key state is keyed by a short hash so API keys never sit in cache keys, registries or logs
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
@@ -0,0 +1,174 @@
+import streamlit as st
+import streamlit.components.v1 as components
+from concurrent.futures import ThreadPoolExecutor
+from cache import TTLCache
+from utils import get_cache_dir
+from tracing import span, in_current_context
+import asyncio
+import base64
+import os
+import re
+import threading
+from lazy_imports import lazy_import
+
+SPEECH_STRIP_TABLE = str.maketrans('', '', '#-*_😊👋😄😁🥳👍🤩😂😎')  # special chars and emojis
+SENTENCE_END = re.compile(r"(?<=[.!?:;])(?<!\d\.)\s+|\n+")  # "1. " starts a list item, not a sentence
+# Very short fragments ("1.", "Sure!") are merged with the next sentence to avoid choppy playback
+MIN_SENTENCE_CHARS = 25
+TTS_WORKERS = 3
+TTS_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_MB", 256)) * 1024 * 1024
+
+
+def clean_text_for_speech(text):
+    return text.translate(SPEECH_STRIP_TABLE)
+
+
+###--- In-memory speech synthesis ---###
+async def synthesize_speech_async(text, voice):
+    audio = bytearray()
+    edge_tts = lazy_import("edge_tts")
+    async for chunk in edge_tts.Communicate(text, voice).stream():
+        if chunk["type"] == "audio":
+            audio.extend(chunk["data"])
+    return bytes(audio)
+
+
+def synthesize_speech(text, voice):
+    return asyncio.run(synthesize_speech_async(text, voice))
+
+
+###--- Synthesized audio shared by all sessions, keyed by (text, voice) ---###
+class SpeechCache:
+    def __init__(self, cache):
+        self.cache = cache
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text, voice):
+        return f"{voice}:{' '.join(text.split())}"
+
+    def synthesize(self, text, voice):
+        with span("tts.synthesize", voice=voice, chars=len(text)) as active:
+            key = self.key(text, voice)
+            audio = self.cache.get(key)
+            if audio is not None:
+                with self._lock:
+                    self.bytes_served += len(audio)
+                active.set(cached=True, bytes=len(audio))
+                return audio
+
+            audio = synthesize_speech(text, voice)
+            if audio:
+                self.cache.set(key, audio)
+            active.set(cached=False, bytes=len(audio))
+            return audio
+
+    def stats(self):
+        return {**self.cache.stats(), "bytes_served": self.bytes_served}
+
+
+@st.cache_resource
+def get_speech_cache():
+    return SpeechCache(TTLCache(maxsize=128, ttl=TTS_CACHE_TTL_SECONDS,
+                                disk_path=os.path.join(get_cache_dir(), "tts_audio.sqlite3"),
+                                disk_max_bytes=TTS_CACHE_MAX_BYTES))
+
+
+def audio_player_html(audio):
+    b64 = base64.b64encode(audio).decode()
+    return f'<audio autoplay="true" src="data:audio/mp3;base64,{b64}">'
+
+
+# Segments are queued on the parent window, so playback keeps its order and survives
+# the component iframe being removed on the next rerun
+QUEUE_PLAYER_JS = """
+<script>
+const w = window.parent;
+w.__voiceQueue = w.__voiceQueue || [];
+w.__voicePlayNext = w.__voicePlayNext || new w.Function(`
+    const src = window.__voiceQueue.shift();
+    if (!src) { window.__voicePlaying = false; return; }
+    window.__voicePlaying = true;
+    const audio = new Audio(src);
+    audio.onended = window.__voicePlayNext;
+    audio.onerror = window.__voicePlayNext;
+    audio.play().catch(window.__voicePlayNext);
+`);
+w.__voiceQueue.push("data:audio/mp3;base64,%s");
+if (!w.__voicePlaying) { w.__voicePlayNext(); }
+</script>
+"""
+
+
+def queue_audio(audio):
+    components.html(QUEUE_PLAYER_JS % base64.b64encode(audio).decode(), height=0)
+
+
+###--- Splitting streamed tokens into sentences ---###
+class SentenceSplitter:
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, token):
+        self._buffer += token
+        parts = SENTENCE_END.split(self._buffer)
+        # The last part is still being generated
+        self._buffer = parts.pop()
+
+        sentences, pending = [], ""
+        for part in parts:
+            pending = f"{pending} {part}".strip()
+            if len(pending) >= self.min_chars:
+                sentences.append(pending)
+                pending = ""
+        if pending:
+            self._buffer = f"{pending} {self._buffer}"
+        return sentences
+
+    def flush(self):
+        sentence, self._buffer = self._buffer.strip(), ""
+        return [sentence] if sentence else []
+
+
+###--- Synthesizing sentences while the LLM is still generating ---###
+class StreamingVoice:
+    def __init__(self, voice, synthesize=None, play=queue_audio):
+        self.voice = voice
+        self.synthesize = synthesize or get_speech_cache().synthesize
+        self.play = play
+        self._splitter = SentenceSplitter()
+        self._pending = []
+        self.failed = 0
+
+    def _submit(self, pool, sentences):
+        for sentence in sentences:
+            text = clean_text_for_speech(sentence).strip()
+            if text:
+                self._pending.append(pool.submit(in_current_context(self.synthesize), text, self.voice))
+
+    def _play_ready(self, wait=False):
+        # Segments are played strictly in order; a finished later sentence waits for earlier ones
+        while self._pending and (wait or self._pending[0].done()):
+            try:
+                audio = self._pending.pop(0).result()
+            except Exception:
+                self.failed += 1  # a TTS hiccup must not break the text answer
+                continue
+            self.play(audio)
+
+    def speak(self, stream):
+        """Yields the stream unchanged and plays each sentence as soon as it is synthesized."""
+        with ThreadPoolExecutor(max_workers=TTS_WORKERS) as pool:
+            for token in stream:
+                yield token
+                self._submit(pool, self._splitter.feed(token))
+                self._play_ready()
+
+            self._submit(pool, self._splitter.flush())
+            self._play_ready(wait=True)
+
+        if self.failed:
+            st.toast(f"{self.failed} part(s) of the voice response could not be generated.", icon="⚠️")